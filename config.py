@@ -10,16 +10,39 @@ class Settings:
     # Database
     SUPABASE_URL: str = os.getenv("SUPABASE_URL")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY")
+    DB_TIMEOUT: float = float(os.getenv("DB_TIMEOUT", "10"))  # Per-call timeout in seconds
+    DB_MAX_CONNECTIONS: int = int(os.getenv("DB_MAX_CONNECTIONS", "50"))
     
     # JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_CACHE_TTL_SECONDS: int = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+    AUTH_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+    SESSION_CACHE_TTL_SECONDS: int = int(os.getenv("SESSION_CACHE_TTL_SECONDS", "60"))
+    SESSION_CACHE_MAX_SIZE: int = int(os.getenv("SESSION_CACHE_MAX_SIZE", "10000"))
+
+    # Password hashing (existing hashes with a different round count are upgraded on login)
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+    # Admin endpoints are disabled unless an API key is configured
+    ADMIN_API_KEY: str = os.getenv("ADMIN_API_KEY")
     
     # File Upload
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: set = {".png", ".jpg", ".jpeg", ".pdf"}
     UPLOAD_FOLDER: str = "uploads"
+    OCR_WORKERS: int = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+    OCR_MAX_QUEUED_JOBS: int = int(os.getenv("OCR_MAX_QUEUED_JOBS", "100"))
+    OCR_STALE_JOB_SECONDS: int = int(os.getenv("OCR_STALE_JOB_SECONDS", "900"))  # Older queued/processing rows are marked failed
+    OCR_STALE_SWEEP_SECONDS: int = int(os.getenv("OCR_STALE_SWEEP_SECONDS", "60"))  # How often to look for them
+    OCR_DPI: int = int(os.getenv("OCR_DPI", "300"))  # Rasterization DPI for scanned PDF pages
+    DOCUMENT_CACHE_PATH: str = os.getenv("DOCUMENT_CACHE_PATH", "cache/documents.sqlite3")
+    REEXTRACT_BATCH_SIZE: int = int(os.getenv("REEXTRACT_BATCH_SIZE", "500"))
+    REEXTRACT_CHECKPOINT_PATH: str = os.getenv("REEXTRACT_CHECKPOINT_PATH", "cache/reextract_checkpoint.json")
+    DOCUMENT_CACHE_MAX_BYTES: int = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # 256MB
     
     # CORS
     CORS_ORIGINS: list = [
@@ -30,6 +53,44 @@ class Settings:
         # Add your production domain here later
     ]
     
+    # LLM (OpenRouter)
+    OPENROUTER_API_URL: str = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+    OPENROUTER_API_KEY: str = os.getenv("OPENROUTER_API_KEY")
+    LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+    LLM_READ_TIMEOUT: float = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+    # Backends in order of preference: "openrouter:<model>[@<url>]" or "local" (deterministic stub, no network)
+    LLM_BACKENDS: str = os.getenv("LLM_BACKENDS", "openrouter:mistralai/mistral-7b-instruct")
+    LLM_ROUTING_WINDOW: int = int(os.getenv("LLM_ROUTING_WINDOW", "100"))  # Recent calls per backend
+    LLM_ROUTING_MIN_SAMPLES: int = int(os.getenv("LLM_ROUTING_MIN_SAMPLES", "10"))
+    LLM_ROUTING_MAX_ERROR_RATE: float = float(os.getenv("LLM_ROUTING_MAX_ERROR_RATE", "0.5"))
+    LLM_ROUTING_EXPLORE_RATE: float = float(os.getenv("LLM_ROUTING_EXPLORE_RATE", "0.05"))
+    LLM_ROUTING_PROBE_SECONDS: float = float(os.getenv("LLM_ROUTING_PROBE_SECONDS", "30"))  # Between retries of an unhealthy backend
+    LOCAL_LLM_DELAY: float = float(os.getenv("LOCAL_LLM_DELAY", "0"))  # Simulated latency of the local stub
+    # Prompt token budgets (estimated); parts are filled in this order: user, document, history
+    PROMPT_MAX_TOKENS: int = int(os.getenv("PROMPT_MAX_TOKENS", "6000"))
+    PROMPT_USER_TOKENS: int = int(os.getenv("PROMPT_USER_TOKENS", "2000"))
+    PROMPT_DOCUMENT_TOKENS: int = int(os.getenv("PROMPT_DOCUMENT_TOKENS", "2000"))
+    PROMPT_HISTORY_TOKENS: int = int(os.getenv("PROMPT_HISTORY_TOKENS", "2000"))
+    PROMPT_SUMMARY_TOKENS: int = int(os.getenv("PROMPT_SUMMARY_TOKENS", "300"))  # Part of the history budget
+    # Document retrieval (TF-IDF over chunks)
+    RETRIEVAL_CHUNK_CHARS: int = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "500"))
+    RETRIEVAL_TOP_K: int = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+    RETRIEVAL_INDEX_CACHE_SIZE: int = int(os.getenv("RETRIEVAL_INDEX_CACHE_SIZE", "256"))
+    # Search (per-user in-memory indexes)
+    SEARCH_INDEX_MAX_BYTES: int = int(os.getenv("SEARCH_INDEX_MAX_BYTES", str(256 * 1024 * 1024)))  # Approximate, across all users
+    SEARCH_INDEX_BUILD_PAGE_SIZE: int = int(os.getenv("SEARCH_INDEX_BUILD_PAGE_SIZE", "200"))  # Rows read per query while building
+    SEARCH_INDEX_TTL_SECONDS: int = int(os.getenv("SEARCH_INDEX_TTL_SECONDS", "1800"))
+    # Chat turns are acknowledged once journaled locally and written to the database in the background
+    CHAT_JOURNAL_PATH: str = os.getenv("CHAT_JOURNAL_PATH", "cache/chat_journal.sqlite3")
+    CHAT_JOURNAL_BATCH_SIZE: int = int(os.getenv("CHAT_JOURNAL_BATCH_SIZE", "200"))  # Turns per flush
+    CHAT_JOURNAL_FLUSH_INTERVAL: float = float(os.getenv("CHAT_JOURNAL_FLUSH_INTERVAL", "0.5"))
+    CHAT_JOURNAL_RETRY_SECONDS: float = float(os.getenv("CHAT_JOURNAL_RETRY_SECONDS", "5"))  # First retry; doubles per attempt
+    CHAT_JOURNAL_MAX_ATTEMPTS: int = int(os.getenv("CHAT_JOURNAL_MAX_ATTEMPTS", "3"))  # Before permanently failing turns are dead-lettered
+    RESPONSE_CACHE_TTL_SECONDS: int = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    RESPONSE_CACHE_MAX_SIZE: int = int(os.getenv("RESPONSE_CACHE_MAX_SIZE", "5000"))
+
     # Tesseract - this fixes your deployment issue!
     TESSERACT_PATH: str = os.getenv("TESSERACT_PATH", "tesseract")
     
@@ -52,8 +52,12 @@ CREATE TABLE IF NOT EXISTS documents (
     user_id UUID NOT NULL REFERENCES users(id),
     filename VARCHAR(255) NOT NULL,
     file_type VARCHAR(10) NOT NULL,
+    content_hash CHAR(64),
     text TEXT,
     medical_data JSONB,
+    status VARCHAR(20) NOT NULL DEFAULT 'done' CHECK (status IN ('queued', 'processing', 'done', 'failed')),
+    error TEXT,
+    processing_stats JSONB,
     processed_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
 );
@@ -94,6 +98,7 @@ CREATE TABLE IF NOT EXISTS medical_summaries (
     id UUID PRIMARY KEY,
     user_id UUID NOT NULL REFERENCES users(id),
     summary TEXT NOT NULL,
+    watermark JSONB,  -- newest document/analysis timestamps covered, for incremental updates
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
 );
 
@@ -191,9 +196,9 @@ CREATE POLICY medical_summaries_insert_policy ON medical_summaries
     FOR INSERT WITH CHECK (auth.uid()::uuid = user_id);
 
 -- Create indexes for performance optimization
-CREATE INDEX idx_documents_user_id ON documents(user_id);
+CREATE INDEX idx_documents_user_created ON documents(user_id, created_at, id);
 CREATE INDEX idx_chat_sessions_user_id ON chat_sessions(user_id);
-CREATE INDEX idx_chat_messages_session_id ON chat_messages(session_id);
+CREATE INDEX idx_chat_messages_session_created ON chat_messages(session_id, created_at, id);
 CREATE INDEX idx_medical_analyses_user_id ON medical_analyses(user_id);
 CREATE INDEX idx_medical_summaries_user_id ON medical_summaries(user_id);
 
@@ -222,6 +227,60 @@ CREATE TRIGGER update_chat_sessions_timestamp
 BEFORE UPDATE ON chat_sessions
 FOR EACH ROW EXECUTE PROCEDURE update_timestamp();
 
+-- Persist one chat turn (its messages and the session preview) in a single
+-- round trip. Runs with the caller's privileges, so RLS still applies.
+-- Messages that already exist are skipped, so replaying a turn is safe.
+CREATE OR REPLACE FUNCTION save_chat_turn(p_session_id UUID, p_messages JSONB, p_last_message TEXT DEFAULT NULL)
+RETURNS SETOF chat_messages AS $$
+    UPDATE chat_sessions SET last_message = p_last_message
+    WHERE id = p_session_id AND p_last_message IS NOT NULL;
+
+    INSERT INTO chat_messages (id, session_id, role, content, created_at)
+    SELECT (m->>'id')::uuid, p_session_id, m->>'role', m->>'content',
+           COALESCE((m->>'created_at')::timestamptz, clock_timestamp())
+    FROM jsonb_array_elements(p_messages) WITH ORDINALITY AS t(m, position)
+    ORDER BY position
+    ON CONFLICT (id) DO NOTHING
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- Write back re-extracted medical_data for a batch of documents in one round
+-- trip. Update only: documents deleted since the batch was read stay deleted.
+CREATE OR REPLACE FUNCTION update_documents_medical_data(p_updates JSONB)
+RETURNS INTEGER AS $$
+    WITH updated AS (
+        UPDATE documents d SET medical_data = u.medical_data
+        FROM jsonb_to_recordset(p_updates) AS u(id UUID, medical_data JSONB)
+        WHERE d.id = u.id
+        RETURNING 1
+    )
+    SELECT count(*)::integer FROM updated;
+$$ LANGUAGE sql;
+
+-- Truncated projections used to build medical history summaries, so the
+-- full document and analysis texts never leave the database
+CREATE OR REPLACE VIEW document_previews WITH (security_invoker = true) AS
+SELECT id, user_id, filename, created_at, left(text, 500) AS text_preview, processed_at
+FROM documents
+WHERE text IS NOT NULL AND text <> '';
+
+CREATE OR REPLACE VIEW medical_analysis_previews WITH (security_invoker = true) AS
+SELECT id, user_id, document_id, created_at, left(analysis, 500) AS analysis_preview
+FROM medical_analyses
+WHERE analysis <> '';
+
+-- Migrations for databases created with an earlier version of this script
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'done'
+    CHECK (status IN ('queued', 'processing', 'done', 'failed'));
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS error TEXT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS processing_stats JSONB;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+ALTER TABLE medical_summaries ADD COLUMN IF NOT EXISTS watermark JSONB;
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_created ON chat_messages(session_id, created_at, id);
+DROP INDEX IF EXISTS idx_chat_messages_session_id;  -- covered by idx_chat_messages_session_created
+CREATE INDEX IF NOT EXISTS idx_documents_user_created ON documents(user_id, created_at, id);
+DROP INDEX IF EXISTS idx_documents_user_id;  -- covered by idx_documents_user_created
+
 -- Sample data for testing (optional - comment out if not needed)
 -- INSERT INTO users (username, email, password, first_name, last_name, role)
 -- VALUES 
@@ -1,5 +1,6 @@
 import logging
-from supabase import create_client, Client
+import httpx
+from supabase import create_client, Client, AsyncClient, AsyncClientOptions
 from config import settings
 from typing import Optional
 
@@ -20,5 +21,45 @@ class DatabaseManager:
                 raise
         return cls._instance
 
-# Global instance
-supabase = DatabaseManager.get_client()
\ No newline at end of file
+class AsyncDatabaseManager:
+    """Async Supabase client used by request handlers.
+
+    All PostgREST calls share one pooled httpx client, so concurrent requests
+    reuse keep-alive connections instead of blocking the event loop.
+    """
+    _instance: Optional[AsyncClient] = None
+    _http_client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def get_client(cls) -> AsyncClient:
+        """Singleton pattern for the async Supabase client"""
+        if cls._instance is None:
+            try:
+                cls._http_client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(settings.DB_TIMEOUT),
+                    limits=httpx.Limits(
+                        max_connections=settings.DB_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.DB_MAX_CONNECTIONS
+                    ),
+                    follow_redirects=True
+                )
+                options = AsyncClientOptions(
+                    httpx_client=cls._http_client,
+                    postgrest_client_timeout=settings.DB_TIMEOUT
+                )
+                cls._instance = AsyncClient(settings.SUPABASE_URL, settings.SUPABASE_KEY, options)
+            except Exception as e:
+                logger.error(f"❌ Failed to create async Supabase client: {e}")
+                raise
+        return cls._instance
+
+    @classmethod
+    async def close(cls):
+        """Close pooled connections (called on application shutdown)"""
+        if cls._http_client is not None:
+            await cls._http_client.aclose()
+        cls._http_client = None
+        cls._instance = None
+
+# Global instance (used by scripts and background threads; handlers use repositories/)
+supabase = DatabaseManager.get_client()
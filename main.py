@@ -1,14 +1,23 @@
 import logging
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.formparsers import MultiPartParser
 import pytesseract
 
 from config import settings
-from routers import auth, documents, chat, profile, medical
+from db import AsyncDatabaseManager
+from routers import auth, documents, chat, profile, medical, admin, search
 from middleware.auth import get_current_user
+from middleware.upload_limit import UploadSizeLimitMiddleware
+from utils.llm_backends import llm_router
+from utils.document_processor import document_processor
+from utils.document_cache import document_cache
+from utils.chat_journal import chat_journal
+from utils.passwords import password_hasher
 
 # Configure logging
 logging.basicConfig(
@@ -17,6 +26,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Replay chat turns journaled but not yet written before the last shutdown
+    await chat_journal.start()
+    # Uploads are lost with the process that held them; fail their rows once stale
+    await document_processor.start()
+    yield
+    await chat_journal.stop()
+    await document_processor.stop()
+    # Release pooled outbound connections
+    await llm_router.aclose()
+    await AsyncDatabaseManager.close()
+    document_processor.shutdown()
+    document_cache.close()
+    password_hasher.shutdown()
+
 # Create FastAPI app
 app = FastAPI(
     title="MedIQ Backend", 
@@ -34,7 +59,8 @@ app = FastAPI(
     
     Test credentials: Use your registered username and password.
     """,
-    swagger_ui_parameters={"persistAuthorization": True}
+    swagger_ui_parameters={"persistAuthorization": True},
+    lifespan=lifespan
 )
 
 # Configure Tesseract for deployment
@@ -43,16 +69,25 @@ if os.name == 'nt':  # Windows
         pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_PATH
 # On Linux (Render), tesseract will be available in PATH
 
-# Create upload directory
-os.makedirs(settings.UPLOAD_FOLDER, exist_ok=True)
+# Refuse oversized uploads before the multipart parser buffers them
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=settings.MAX_FILE_SIZE + 64 * 1024,  # Allow for multipart framing
+    paths={"/docs/upload"},
+)
+
+# Starlette spools file parts over 1MB to a temporary file on disk; the limit
+# above already bounds the body, so keep uploads up to that size in memory
+MultiPartParser.spool_max_size = settings.MAX_FILE_SIZE
 
-# Add CORS middleware
+# Add CORS middleware (added last so it wraps every response, including 413s)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Health check endpoint
@@ -71,3 +106,5 @@ app.include_router(documents.router, prefix="/docs", tags=["Documents"])
 app.include_router(chat.router, prefix="/chat", tags=["Chat"])
 app.include_router(profile.router, prefix="/profile", tags=["User Profiles"])
 app.include_router(medical.router, prefix="/medical", tags=["Medical Analysis"])
+app.include_router(search.router, prefix="/search", tags=["Search"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
@@ -1,15 +1,25 @@
-from fastapi import HTTPException, Depends, status
+from fastapi import HTTPException, Depends, Header, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt as PyJWT
 from config import settings
-from db import supabase
+from models.users import AuthenticatedUser
+from repositories import users as users_repo
+from utils.cache import TTLCache
+import hmac
 import logging
 
 logger = logging.getLogger(__name__)
 security = HTTPBearer()
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    """Verify JWT token and return username"""
+# Verified principals by username, so authenticated requests skip the users lookup
+principal_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+
+def invalidate_principal(username: str):
+    """Drop a cached principal, e.g. after the user is deleted or their role changes"""
+    principal_cache.pop(username)
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> AuthenticatedUser:
+    """Verify JWT token and return the authenticated user"""
     try:
         token = credentials.credentials
         payload = PyJWT.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -21,15 +31,21 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
                 detail="Invalid token payload"
             )
         
+        principal = principal_cache.get(username)
+        if principal is not None:
+            return principal
+
         # Verify user exists in database
-        result = supabase.table("users").select("username").eq("username", username).execute()
-        if not result.data:
+        user = await users_repo.get_user_by("username", username, "id, username, role")
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not found"
             )
         
-        return username
+        principal = AuthenticatedUser(**user)
+        principal_cache.set(username, principal)
+        return principal
         
     except PyJWT.ExpiredSignatureError:
         raise HTTPException(
@@ -43,6 +59,23 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
             detail="Could not validate credentials"
         )
 
-def get_current_user(username: str = Depends(verify_token)) -> str:
-    """Get current authenticated user"""
-    return username
\ No newline at end of file
+def get_current_principal(principal: AuthenticatedUser = Depends(verify_token)) -> AuthenticatedUser:
+    """Get current authenticated user with id and role"""
+    return principal
+
+def get_current_user(principal: AuthenticatedUser = Depends(verify_token)) -> str:
+    """Get current authenticated username"""
+    return principal.username
+
+def verify_admin_key(x_admin_key: str = Header(None)) -> None:
+    """Guard admin endpoints with the X-Admin-Key header"""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin API is disabled"
+        )
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid admin key"
+        )
@@ -0,0 +1,81 @@
+import json
+import logging
+from typing import Iterable
+from fastapi import HTTPException, status
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+def upload_too_large_detail() -> str:
+    return f"File too large. Maximum size is {settings.MAX_FILE_SIZE // (1024 * 1024)}MB."
+
+class UploadTooLarge(HTTPException):
+    """Raised from the receive channel; an HTTPException so body parsing re-raises it as 413"""
+
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=upload_too_large_detail())
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized request bodies on upload routes before they are parsed.
+
+    Requests announcing a Content-Length above the limit are refused without
+    reading the body; chunked bodies are counted as they stream and aborted as
+    soon as they cross the limit, so the multipart parser never spools them.
+    """
+
+    def __init__(self, app, max_body_size: int, paths: Iterable[str]):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                if int(content_length) > self.max_body_size:
+                    await self._reject(send)
+                    return
+            except ValueError:
+                pass
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise UploadTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            logger.warning(f"Rejected upload to {scope['path']} after {received} bytes")
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": upload_too_large_detail()}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,74 @@
+from fastapi import Depends, HTTPException, status
+from typing import Any, Dict, Optional
+from middleware.auth import get_current_principal
+from models.users import AuthenticatedUser, UserRole
+from repositories import users as users_repo
+
+USER_COLUMNS = "id, username, email, first_name, last_name, role"
+
+PROFILE_TABLES = {
+    UserRole.PATIENT: "patient_profiles",
+    UserRole.DOCTOR: "doctor_profiles",
+}
+
+class UserContext:
+    """Request-scoped view of the current user.
+
+    id, username and role come from the verified token. The users row and the
+    role-specific profile are loaded together in one embedded (joined) query,
+    the first time either is needed, and then reused for the rest of the
+    request.
+    """
+
+    def __init__(self, principal: AuthenticatedUser):
+        self.principal = principal
+        self._loaded = False
+        self._user: Optional[Dict[str, Any]] = None
+        self._profile: Optional[Dict[str, Any]] = None
+
+    @property
+    def id(self) -> str:
+        return self.principal.id
+
+    @property
+    def username(self) -> str:
+        return self.principal.username
+
+    @property
+    def role(self) -> UserRole:
+        return self.principal.role
+
+    @property
+    def profile_table(self) -> str:
+        return PROFILE_TABLES[self.role]
+
+    async def _load(self):
+        if self._loaded:
+            return
+        row = await users_repo.get_user_with_profile(self.id, USER_COLUMNS, self.profile_table)
+        if not row:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+
+        user = dict(row)
+        profile = user.pop(self.profile_table, None)
+        # One-to-one embeds come back as an object, older PostgREST returns a list
+        if isinstance(profile, list):
+            profile = profile[0] if profile else None
+
+        self._user = user
+        self._profile = profile
+        self._loaded = True
+
+    async def get_user(self) -> Dict[str, Any]:
+        """The users row (without the password hash)"""
+        await self._load()
+        return self._user
+
+    async def get_profile(self) -> Optional[Dict[str, Any]]:
+        """The patient or doctor profile row, if one exists"""
+        await self._load()
+        return self._profile
+
+def get_user_context(principal: AuthenticatedUser = Depends(get_current_principal)) -> UserContext:
+    """Dependency providing the per-request user context (FastAPI caches it per request)"""
+    return UserContext(principal)
@@ -13,6 +13,12 @@ class UserBase(BaseModel):
     last_name: str
     role: UserRole = UserRole.PATIENT
 
+class AuthenticatedUser(BaseModel):
+    """Principal resolved from a verified access token"""
+    id: str
+    username: str
+    role: UserRole
+
 class UserCreate(UserBase):
     password: str = Field(..., min_length=6)
 
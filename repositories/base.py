@@ -0,0 +1,31 @@
+import asyncio
+import logging
+from typing import Any, Optional
+
+from fastapi import HTTPException, status
+
+from config import settings
+from db import AsyncDatabaseManager
+
+logger = logging.getLogger(__name__)
+
+def table(name: str):
+    """Start a query on a table using the shared async client"""
+    return AsyncDatabaseManager.get_client().table(name)
+
+def rpc(name: str, params: Optional[dict] = None):
+    """Start a call to a Postgres function using the shared async client"""
+    return AsyncDatabaseManager.get_client().rpc(name, params or {})
+
+async def execute(query, timeout: Optional[float] = None) -> Any:
+    """Execute a query builder, failing with 504 if it exceeds the per-call timeout"""
+    try:
+        return await asyncio.wait_for(query.execute(), timeout or settings.DB_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.error("Database call timed out")
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Database request timed out")
+
+async def fetch_one(query, timeout: Optional[float] = None) -> Optional[dict]:
+    """Execute a query and return its first row, or None"""
+    result = await execute(query, timeout)
+    return result.data[0] if result.data else None
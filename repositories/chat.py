@@ -0,0 +1,98 @@
+from typing import Any, Dict, List, Optional, Sequence
+from repositories.base import table, rpc, execute, fetch_one
+
+# Sessions
+async def list_sessions(username: str) -> List[Dict[str, Any]]:
+    result = await execute(
+        table("chat_sessions").select("*").eq("user_id", username).order("updated_at", desc=True)
+    )
+    return result.data
+
+async def list_user_messages_page(username: str, limit: int, after: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Get messages across all of a user's sessions oldest first, starting after a (created_at, id) position"""
+    query = table("chat_messages") \
+        .select("id, session_id, role, content, created_at, chat_sessions!inner(user_id)") \
+        .eq("chat_sessions.user_id", username) \
+        .order("created_at") \
+        .order("id") \
+        .limit(limit)
+    if after:
+        created_at, message_id = after
+        query = query.or_(
+            f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{message_id}")'
+        )
+    result = await execute(query)
+    return result.data
+
+async def get_session_with_recent_messages(session_id: str, username: str, limit: int) -> Optional[Dict[str, Any]]:
+    """Get a session owned by the user together with its newest messages, in one query.
+
+    The messages come back oldest first under "chat_messages"; they are read
+    backwards along the (session_id, created_at, id) index, so the cost does
+    not grow with the length of the session. Returns None when the session
+    does not exist or belongs to someone else.
+    """
+    query = table("chat_sessions") \
+        .select("id, chat_messages(id, role, content, created_at)") \
+        .eq("id", session_id) \
+        .eq("user_id", username) \
+        .order("created_at", desc=True, foreign_table="chat_messages") \
+        .order("id", desc=True, foreign_table="chat_messages") \
+        .limit(limit, foreign_table="chat_messages")
+    session = await fetch_one(query)
+    if session is not None:
+        session["chat_messages"] = list(reversed(session.get("chat_messages") or []))
+    return session
+
+async def get_session(session_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+    return await fetch_one(table("chat_sessions").select(columns).eq("id", session_id))
+
+async def create_session(session_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return await fetch_one(table("chat_sessions").insert(session_data))
+
+async def update_session(session_id: str, update_data: Dict[str, Any]):
+    await execute(table("chat_sessions").update(update_data).eq("id", session_id))
+
+async def delete_session(session_id: str):
+    await execute(table("chat_sessions").delete().eq("id", session_id))
+
+# Messages
+async def list_messages(session_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    """Get messages in a session, oldest first"""
+    query = table("chat_messages") \
+        .select("*") \
+        .eq("session_id", session_id) \
+        .order("created_at", desc=False) \
+        .limit(limit) \
+        .offset(offset)
+    result = await execute(query)
+    return result.data
+
+async def list_messages_after(session_id: str, limit: int, after: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Get messages oldest first, starting after a (created_at, id) position (keyset pagination)"""
+    query = table("chat_messages") \
+        .select("*") \
+        .eq("session_id", session_id) \
+        .order("created_at") \
+        .order("id") \
+        .limit(limit)
+    if after:
+        created_at, message_id = after
+        query = query.or_(
+            f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{message_id}")'
+        )
+    result = await execute(query)
+    return result.data
+
+async def save_chat_turn(
+    session_id: str,
+    messages: List[Dict[str, Any]],
+    last_message: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Insert a turn's messages and update the session preview in one call (save_chat_turn function)"""
+    result = await execute(rpc("save_chat_turn", {
+        "p_session_id": session_id,
+        "p_messages": messages,
+        "p_last_message": last_message
+    }))
+    return result.data or []
@@ -0,0 +1,69 @@
+from typing import Any, Dict, List, Optional, Sequence
+from repositories.base import table, execute, fetch_one
+
+async def insert_document(doc_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return await fetch_one(table("documents").insert(doc_data))
+
+async def get_document(document_id: str, username: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+    """Get a document owned by the user"""
+    return await fetch_one(
+        table("documents").select(columns).eq("id", document_id).eq("user_id", username)
+    )
+
+async def document_exists(document_id: str) -> bool:
+    return await fetch_one(table("documents").select("id").eq("id", document_id)) is not None
+
+async def list_documents(username: str, columns: str = "*") -> List[Dict[str, Any]]:
+    result = await execute(table("documents").select(columns).eq("user_id", username))
+    return result.data
+
+async def list_documents_page(
+    username: str,
+    columns: str,
+    limit: int,
+    before: Optional[Sequence[str]] = None
+) -> List[Dict[str, Any]]:
+    """Get documents newest first, starting before a (created_at, id) position (keyset pagination)"""
+    query = table("documents") \
+        .select(columns) \
+        .eq("user_id", username) \
+        .order("created_at", desc=True) \
+        .order("id", desc=True) \
+        .limit(limit)
+    if before:
+        created_at, document_id = before
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{document_id}")'
+        )
+    result = await execute(query)
+    return result.data
+
+async def update_document(document_id: str, update_data: Dict[str, Any]):
+    await execute(table("documents").update(update_data).eq("id", document_id))
+
+async def fail_documents(
+    statuses: Sequence[str],
+    created_before: str,
+    error: str,
+    exclude_ids: Sequence[str] = ()
+) -> List[Dict[str, Any]]:
+    """Mark documents still in one of the statuses and created before a time as failed"""
+    query = table("documents") \
+        .update({"status": "failed", "error": error}) \
+        .in_("status", list(statuses)) \
+        .lt("created_at", created_before)
+    if exclude_ids:
+        query = query.not_.in_("id", list(exclude_ids))
+    result = await execute(query)
+    return result.data
+
+async def list_document_previews(username: str, processed_after: Optional[str] = None) -> List[Dict[str, Any]]:
+    """First 500 characters of each processed document, in processing order (document_previews view)"""
+    query = table("document_previews") \
+        .select("id, text_preview, processed_at") \
+        .eq("user_id", username) \
+        .order("processed_at")
+    if processed_after:
+        query = query.gt("processed_at", processed_after)
+    result = await execute(query)
+    return result.data
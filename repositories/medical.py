@@ -0,0 +1,35 @@
+from typing import Any, Dict, List, Optional
+from repositories.base import table, execute, fetch_one
+
+# Analyses
+async def insert_analysis(analysis_data: Dict[str, Any]):
+    await execute(table("medical_analyses").insert(analysis_data))
+
+async def get_analysis(analysis_id: str, username: str) -> Optional[Dict[str, Any]]:
+    """Get an analysis owned by the user"""
+    return await fetch_one(
+        table("medical_analyses").select("*").eq("id", analysis_id).eq("user_id", username)
+    )
+
+async def list_analysis_previews(username: str, created_after: Optional[str] = None) -> List[Dict[str, Any]]:
+    """First 500 characters of each analysis, oldest first (medical_analysis_previews view)"""
+    query = table("medical_analysis_previews") \
+        .select("id, analysis_preview, created_at") \
+        .eq("user_id", username) \
+        .order("created_at")
+    if created_after:
+        query = query.gt("created_at", created_after)
+    result = await execute(query)
+    return result.data
+
+# Summaries
+async def get_latest_summary(username: str) -> Optional[Dict[str, Any]]:
+    query = table("medical_summaries") \
+        .select("id, summary, watermark, created_at") \
+        .eq("user_id", username) \
+        .order("created_at", desc=True) \
+        .limit(1)
+    return await fetch_one(query)
+
+async def insert_summary(summary_data: Dict[str, Any]):
+    await execute(table("medical_summaries").insert(summary_data))
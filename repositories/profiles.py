@@ -0,0 +1,10 @@
+from typing import Any, Dict, Optional
+from repositories.base import table, execute, fetch_one
+
+async def create_profile(profile_table: str, user_id: str):
+    """Create an empty patient or doctor profile"""
+    await execute(table(profile_table).insert({"user_id": user_id}))
+
+async def upsert_profile(profile_table: str, profile_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Create or update a profile in a single round trip"""
+    return await fetch_one(table(profile_table).upsert(profile_data, on_conflict="user_id"))
@@ -0,0 +1,21 @@
+from typing import Any, Dict, Optional
+from repositories.base import table, execute, fetch_one
+
+async def get_user_by(column: str, value: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+    """Get a single user by a unique column (username, email or id)"""
+    return await fetch_one(table("users").select(columns).eq(column, value))
+
+async def get_user_with_profile(user_id: str, user_columns: str, profile_table: str) -> Optional[Dict[str, Any]]:
+    """Get a user row with its role-specific profile embedded, in one query"""
+    return await fetch_one(
+        table("users").select(f"{user_columns}, {profile_table}(*)").eq("id", user_id)
+    )
+
+async def create_user(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return await fetch_one(table("users").insert(user_data))
+
+async def update_user(username: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return await fetch_one(table("users").update(update_data).eq("username", username))
+
+async def update_password(user_id: str, hashed_password: str):
+    await execute(table("users").update({"password": hashed_password}).eq("id", user_id))
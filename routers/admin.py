@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, HTTPException
+import threading
+import logging
+from config import settings
+from middleware.auth import verify_admin_key, principal_cache
+from routers.chat import session_cache
+from models.responses import BaseResponse
+from utils.batch_reextract import ReextractionJob
+from utils.chat_journal import chat_journal
+from utils.document_cache import document_cache
+from utils.passwords import password_hasher
+from utils.response_cache import response_cache
+from utils.singleflight import llm_singleflight
+from utils.llm_backends import llm_router
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(dependencies=[Depends(verify_admin_key)])
+
+reextraction_job = ReextractionJob(
+    batch_size=settings.REEXTRACT_BATCH_SIZE,
+    workers=settings.OCR_WORKERS,
+    checkpoint_path=settings.REEXTRACT_CHECKPOINT_PATH
+)
+_reextraction_thread = None
+
+def _run_reextraction(resume: bool):
+    try:
+        reextraction_job.run(resume=resume)
+    except Exception as e:
+        logger.error(f"Background re-extraction failed: {e}")
+
+@router.post("/reextract", response_model=BaseResponse, status_code=202)
+def start_reextraction(resume: bool = True):
+    """Re-run medical extraction over every stored document in the background"""
+    global _reextraction_thread
+    if _reextraction_thread is not None and _reextraction_thread.is_alive():
+        raise HTTPException(status_code=409, detail="Re-extraction is already running")
+
+    _reextraction_thread = threading.Thread(target=_run_reextraction, args=(resume,), daemon=True)
+    _reextraction_thread.start()
+    return BaseResponse(success=True, message="Re-extraction started", data=reextraction_job.status)
+
+@router.get("/reextract", response_model=BaseResponse)
+def get_reextraction_status():
+    """Get progress of the current or last re-extraction run"""
+    return BaseResponse(success=True, message="Re-extraction status", data=reextraction_job.status)
+
+@router.delete("/reextract", response_model=BaseResponse)
+def stop_reextraction():
+    """Stop the running re-extraction after its current batch; it can be resumed later"""
+    reextraction_job.stop()
+    return BaseResponse(success=True, message="Re-extraction stopping", data=reextraction_job.status)
+
+@router.get("/metrics", response_model=BaseResponse)
+def get_metrics():
+    """Runtime metrics for the worker pools and caches"""
+    return BaseResponse(success=True, message="Metrics", data={
+        "password_hasher": password_hasher.stats(),
+        "auth_cache": principal_cache.stats(),
+        "session_cache": session_cache.stats(),
+        "document_cache": document_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "llm_singleflight": llm_singleflight.stats(),
+        "llm_backends": llm_router.stats(),
+        "chat_journal": chat_journal.stats()
+    })
@@ -1,16 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field, EmailStr
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from db import supabase
 from fastapi import status
 from dotenv import load_dotenv
 import os
+import asyncio
+import logging
 import jwt as PyJWT
 from models.users import UserRole
+from repositories import users as users_repo, profiles as profiles_repo
+from utils.passwords import password_hasher
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 # Configs
@@ -18,8 +22,6 @@ SECRET_KEY = os.getenv("SECRET_KEY", "fallback-secret-key")  # Default for dev
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=12)
-
 # Models
 class UserLogin(BaseModel):
     username: str = Field(..., min_length=3, max_length=50)
@@ -42,50 +44,57 @@ def create_access_token(data: dict):
 
 # Routes
 @router.post("/signup")
-def signup(user: UserRegistration):
-    # Check for existing username
-    existing = supabase.table("users").select("*").eq("username", user.username).execute()
-    if existing.data:
+async def signup(user: UserRegistration):
+    # Check for existing username and email concurrently
+    existing_username, existing_email = await asyncio.gather(
+        users_repo.get_user_by("username", user.username, "id"),
+        users_repo.get_user_by("email", user.email, "id")
+    )
+    if existing_username:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists")
     
-    # Check for existing email
-    existing_email = supabase.table("users").select("*").eq("email", user.email).execute()
-    if existing_email.data:
+    if existing_email:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
     
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     
     # Create user in database
-    result = supabase.table("users").insert({
+    created = await users_repo.create_user({
         "username": user.username,
         "email": user.email,
         "password": hashed_password,
         "first_name": user.first_name,
         "last_name": user.last_name,
         "role": user.role
-    }).execute()
+    })
 
-    if not result.data:
+    if not created:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create user")
     
     # Create role-specific profile
-    user_id = result.data[0]["id"]
     if user.role == UserRole.PATIENT:
-        supabase.table("patient_profiles").insert({"user_id": user_id}).execute()
+        await profiles_repo.create_profile("patient_profiles", created["id"])
     elif user.role == UserRole.DOCTOR:
-        supabase.table("doctor_profiles").insert({"user_id": user_id}).execute()
+        await profiles_repo.create_profile("doctor_profiles", created["id"])
 
-    return {"msg": "User created", "user": result.data[0]["username"]}
+    return {"msg": "User created", "user": created["username"]}
 
 @router.post("/login")
-def login(user: UserLogin):
-    result = supabase.table("users").select("*").eq("username", user.username).execute()
-    if not result.data:
+async def login(user: UserLogin):
+    stored_user = await users_repo.get_user_by("username", user.username)
+    if not stored_user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     
-    stored_user = result.data[0]
-    if not pwd_context.verify(user.password, stored_user["password"]):
+    verified, new_hash = await password_hasher.verify_and_update(user.password, stored_user["password"])
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
 
+    # Transparently upgrade hashes made with an old round count
+    if new_hash:
+        try:
+            await users_repo.update_password(stored_user["id"], new_hash)
+        except Exception as e:
+            logger.warning(f"Failed to rehash password for {user.username}: {e}")
+
     token = create_access_token({"sub": user.username})
-    return {"access_token": token, "token_type": "bearer", "role": stored_user["role"]}
\ No newline at end of file
+    return {"access_token": token, "token_type": "bearer", "role": stored_user["role"]}
@@ -1,20 +1,38 @@
-import requests
-import json
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from db import supabase  # Ensure Supabase client is properly configured in the db module
+from repositories import chat as chat_repo, documents as documents_repo
+import asyncio
 import uuid
-import os
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import json
+from typing import List, Dict, Any, Optional, AsyncIterator
+from datetime import datetime, timezone
 from middleware.auth import get_current_user
 from models.responses import BaseResponse
+from utils.llm_backends import llm_router
+from utils.pagination import encode_cursor, decode_cursor
+from utils.prompt_builder import prompt_builder
+from utils.retrieval import document_retriever, DocumentRetriever
+from utils.search_index import search_index
+from utils.chat_journal import chat_journal
+from utils.cache import TTLCache
+from utils.singleflight import llm_singleflight, payload_key
+from config import settings
 
 router = APIRouter()
 
-# OpenRouter API Configuration
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")  # Set your OpenRouter API key as an environment variable
+# Number of most recent messages considered as conversation context; the
+# prompt builder keeps what fits its budget and summarizes the rest
+CHAT_HISTORY_WINDOW = 30
+
+SYSTEM_PROMPT = "You are MedIQ, an advanced medical assistant. Help users understand medical information, analyze symptoms, interpret medical documents, and provide reliable health information. Always maintain a professional, empathetic tone. Remind users that you are an AI and cannot provide definitive medical diagnoses, and they should consult healthcare professionals for proper medical advice."
+
+HISTORY_CURSOR_FIELDS = ["created_at", "id"]
+
+# Session metadata by session id, so ownership checks skip the chat_sessions lookup.
+# last_message changes on every turn and is deliberately not cached.
+SESSION_METADATA_FIELDS = ("id", "user_id", "title", "document_id", "started_at", "ended_at")
+session_cache = TTLCache(maxsize=settings.SESSION_CACHE_MAX_SIZE, ttl=settings.SESSION_CACHE_TTL_SECONDS)
 
 # Models
 class ChatRequest(BaseModel):
@@ -23,6 +41,7 @@ class ChatRequest(BaseModel):
     user_message: str
     document_id: Optional[str] = None
     include_document_context: bool = True
+    stream: bool = False  # Stream tokens back as Server-Sent Events
 
 class ChatSession(BaseModel):
     id: str
@@ -45,90 +64,115 @@ class UpdateSessionRequest(BaseModel):
     title: Optional[str] = None
     ended_at: Optional[bool] = None  # True to end the session 
 
-def get_chat_history(session_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+async def get_chat_history(session_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
     """Get chat history for a specific session"""
     try:
-        result = supabase.table("chat_messages") \
-            .select("*") \
-            .eq("session_id", session_id) \
-            .order("created_at", desc=False) \
-            .limit(limit) \
-            .offset(offset) \
-            .execute()
-        return result.data
+        return await chat_repo.list_messages(session_id, limit, offset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch chat history: {e}")
+
+async def get_session_context(session_id: str, username: str, limit: int = CHAT_HISTORY_WINDOW) -> List[Dict[str, Any]]:
+    """Check the session belongs to the user and get its most recent messages, in chronological order"""
+    try:
+        session = await chat_repo.get_session_with_recent_messages(session_id, username, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch chat history: {e}")
+    if session is None:
+        raise HTTPException(status_code=403, detail="Chat session not found or access denied")
+    # Include turns that are journaled but not yet written to the database
+    saved_ids = {message["id"] for message in session["chat_messages"]}
+    pending = [message for message in chat_journal.pending_messages(session_id) if message["id"] not in saved_ids]
+    return (session["chat_messages"] + pending)[-limit:]
+
+def parse_history_cursor(cursor: Optional[str]) -> Optional[List[str]]:
+    """Decode a history cursor into its (created_at, id) position"""
+    position = decode_cursor(cursor, len(HISTORY_CURSOR_FIELDS))
+    if position is None:
+        return None
+    try:
+        datetime.fromisoformat(position[0])
+        uuid.UUID(position[1])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
 
-def get_user_chat_sessions(username: str) -> List[Dict[str, Any]]:
+async def get_user_chat_sessions(username: str) -> List[Dict[str, Any]]:
     """Get all chat sessions for a user"""
     try:
-        result = supabase.table("chat_sessions") \
-            .select("*") \
-            .eq("user_id", username) \
-            .order("updated_at", desc=True) \
-            .execute()
-        return result.data
+        return await chat_repo.list_sessions(username)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch chat sessions: {e}")
 
-def check_session_exists(session_id: str, username: str) -> bool:
-    """Check if a session exists and belongs to the user"""
+def cache_session(session: Dict[str, Any]):
+    session_cache.set(session["id"], {field: session.get(field) for field in SESSION_METADATA_FIELDS})
+
+def invalidate_session(session_id: str):
+    """Drop cached metadata after a session is updated or deleted"""
+    session_cache.pop(session_id)
+
+async def get_session_metadata(session_id: str) -> Optional[Dict[str, Any]]:
+    """Get a session's owner, title, document and timestamps, from the cache when possible"""
+    session = session_cache.get(session_id)
+    if session is not None:
+        return session
     try:
-        result = supabase.table("chat_sessions") \
-            .select("id") \
-            .eq("id", session_id) \
-            .eq("user_id", username) \
-            .execute()
-        return len(result.data) > 0
+        session = await chat_repo.get_session(session_id, ", ".join(SESSION_METADATA_FIELDS))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to check session: {e}")
+    if session:
+        cache_session(session)
+    return session
 
-def call_openrouter_model(document: str, user_message: str, history: List[Dict[str, str]] = None) -> str:
-    """Call OpenRouter API to generate a chat response using Mistral 7B Instruct."""
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    
-    # Start with system messages
-    messages = [
-        {"role": "system", "content": "You are MedIQ, an advanced medical assistant. Help users understand medical information, analyze symptoms, interpret medical documents, and provide reliable health information. Always maintain a professional, empathetic tone. Remind users that you are an AI and cannot provide definitive medical diagnoses, and they should consult healthcare professionals for proper medical advice."}
-    ]
-    
-    # Add document context if provided
-    if document and document.strip():
-        messages.append({"role": "system", "content": f"Document: {document[:5000]}"})  # Limit document size
-    
-    # Add conversation history
-    if history and len(history) > 0:
-        messages.extend(history)
-    
-    # Add the current user message
-    messages.append({"role": "user", "content": user_message})
+async def check_session_exists(session_id: str, username: str) -> bool:
+    """Check if a session exists and belongs to the user"""
+    session = await get_session_metadata(session_id)
+    return session is not None and session.get("user_id") == username
+
+def build_chat_payload(
+    document: str,
+    user_message: str,
+    history: List[Dict[str, str]] = None,
+    session_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Build the chat completion payload; the model is chosen by the LLM router."""
+    # Document, history and user message are fitted to the prompt token budget
+    messages = prompt_builder.build(SYSTEM_PROMPT, user_message, document, history, session_id)
     
     payload = {
-        "model": "mistralai/mistral-7b-instruct",  # Using Mistral 7B Instruct
         "messages": messages,
         "temperature": 0.7,  # Add some controlled randomness
         "max_tokens": 1000   # Limit response length
     }
+    return payload
 
-    response = requests.post(
-        url=OPENROUTER_API_URL,
-        headers=headers,
-        data=json.dumps(payload)
-    )
+async def call_openrouter_model(
+    document: str,
+    user_message: str,
+    history: List[Dict[str, str]] = None,
+    session_id: Optional[str] = None
+) -> str:
+    """Generate a chat response with the configured LLM backends (OpenRouter by default).
 
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail=f"Error from OpenRouter API: {response.text}")
+    Identical calls already in flight (double submits, client retries) share one upstream request.
+    """
+    payload = build_chat_payload(document, user_message, history, session_id)
+    return await llm_singleflight.do(payload_key(payload), lambda: llm_router.complete(payload))
 
-    try:
-        result = response.json()
-        return result["choices"][0]["message"]["content"]  # Adjust based on API response structure
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to parse OpenRouter response: {e}")
+def stream_openrouter_model(
+    document: str,
+    user_message: str,
+    history: List[Dict[str, str]] = None,
+    session_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Stream a chat response from the configured LLM backends, yielding content deltas."""
+    payload = build_chat_payload(document, user_message, history, session_id)
+    return llm_router.stream(payload)
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-def create_chat_session(session_id: str, username: str, title: str = None, document_id: str = None) -> Dict[str, Any]:
+async def create_chat_session(session_id: str, username: str, title: str = None, document_id: str = None) -> Dict[str, Any]:
     """Create a new chat session in Supabase."""
     try:
         # Create basic session data
@@ -145,53 +189,114 @@ def create_chat_session(session_id: str, username: str, title: str = None, docum
         # Only add document_id if it's a valid non-empty value
         if document_id and document_id.strip():
             # Check if the document exists before referencing it
-            doc_check = supabase.table("documents").select("id").eq("id", document_id).execute()
-            if doc_check.data:
+            if await documents_repo.document_exists(document_id):
                 session_data["document_id"] = document_id
         
         # Insert the session data
-        result = supabase.table("chat_sessions").insert(session_data).execute()
-        return result.data[0] if result.data else {}
+        session = await chat_repo.create_session(session_data)
+        if session:
+            cache_session(session)
+        else:
+            invalidate_session(session_id)
+        return session or {}
     except Exception as e:
         # Log the detailed error for debugging
         print(f"Chat session creation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to create chat session: {str(e)}")
-def save_message_to_supabase(session_id: str, role: str, content: str) -> Dict[str, Any]:
-    """Save a chat message to Supabase."""
+def new_message(session_id: str, role: str, content: str) -> Dict[str, Any]:
+    """A chat message ready to be saved; id and timestamp are set here so a turn can be written in one call"""
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+async def save_chat_turn(session_id: str, messages: List[Dict[str, Any]], username: str) -> List[Dict[str, Any]]:
+    """Save a turn's messages and the session's last_message preview.
+
+    The turn is appended to the local chat journal and written to Supabase
+    in the background, so the reply does not wait on the database.
+    """
+    # Limit message preview to 100 characters
+    user_messages = [message for message in messages if message["role"] == "user"]
+    preview = (user_messages[-1]["content"] or "")[:100] if user_messages else None
     try:
-        message_id = str(uuid.uuid4())
-        
-        # Insert the message
-        message_data = {
-            "id": message_id,
-            "session_id": session_id,
-            "role": role,
-            "content": content
-            # Don't include created_at as it has a default value in the DB
-        }
-        
-        result = supabase.table("chat_messages").insert(message_data).execute()
-        
-        # Also update the last_message field in the session
-        if role == "user":
-            # Limit message preview to 100 characters
-            preview = content[:100] if content else ""
-            
-            update_data = {
-                "last_message": preview
-                # Don't include updated_at as it will be handled by the trigger
-            }
-            
-            supabase.table("chat_sessions").update(update_data).eq("id", session_id).execute()
-            
-        return result.data[0] if result.data else {"id": message_id}
+        await chat_journal.append(
+            session_id,
+            [{key: message[key] for key in ("id", "role", "content", "created_at")} for message in messages],
+            preview
+        )
     except Exception as e:
         # Log the detailed error for debugging
-        print(f"Save message error: {str(e)}")
+        print(f"Save chat turn error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to save chat message: {str(e)}")
 
+    for message in messages:
+        search_index.add_message(username, session_id, message)
+    return messages
+
+async def stream_chat_events(
+    request: Request,
+    username: str,
+    session_id: str,
+    is_new_session: bool,
+    user_msg: Dict[str, Any],
+    document_text: str,
+    history: List[Dict[str, str]]
+) -> AsyncIterator[str]:
+    """Relay OpenRouter tokens as SSE and persist the turn once the stream ends.
+
+    If the turn is not saved (error, disconnect or cancellation), the user's
+    message is still saved on the way out.
+    """
+    saved = False
+    try:
+        yield format_sse("start", {
+            "session_id": session_id,
+            "user_message_id": user_msg["id"],
+            "is_new_session": is_new_session
+        })
+
+        parts = []
+        try:
+            async for delta in stream_openrouter_model(document_text, user_msg["content"], history, session_id):
+                # Returning closes the upstream stream, cancelling generation
+                if await request.is_disconnected():
+                    return
+                parts.append(delta)
+                yield format_sse("token", {"delta": delta})
+        except HTTPException as e:
+            yield format_sse("error", {"detail": e.detail})
+            return
+
+        response = "".join(parts)
+        assistant_msg = new_message(session_id, "assistant", response)
+        try:
+            await save_chat_turn(session_id, [user_msg, assistant_msg], username)
+            saved = True
+        except HTTPException as e:
+            yield format_sse("error", {"detail": e.detail})
+            return
+
+        yield format_sse("done", {
+            "session_id": session_id,
+            "response": response,
+            "user_message_id": user_msg["id"],
+            "assistant_message_id": assistant_msg["id"],
+            "is_new_session": is_new_session
+        })
+    finally:
+        if not saved:
+            try:
+                # Shielded so a cancelled request still records the user's message
+                await asyncio.shield(save_chat_turn(session_id, [user_msg], username))
+            except HTTPException:
+                pass
+
 @router.post("/chat")
-async def chat_endpoint(data: ChatRequest, username: str = Depends(get_current_user)):
+async def chat_endpoint(data: ChatRequest, request: Request, username: str = Depends(get_current_user)):
     """Chat with the AI assistant"""
     try:
         # Set default values if needed
@@ -208,50 +313,79 @@ async def chat_endpoint(data: ChatRequest, username: str = Depends(get_current_u
         # Create a new chat session if it's a new session
         if is_new_session:
             title = f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-            create_chat_session(session_id, username, title, data.document_id)
+            await create_chat_session(session_id, username, title, data.document_id)
     
         # Get chat history if this is an existing session
         chat_history = []
         history_for_api = []
         if not is_new_session:
-            # Check if the session exists and belongs to the user
-            if not check_session_exists(session_id, username):
-                raise HTTPException(status_code=403, detail="Chat session not found or access denied")
-            
-            # Get previous messages
-            chat_history = get_chat_history(session_id, limit=10)  # Last 10 messages
+            # Check the session belongs to the user and get its most recent messages in one query
+            chat_history = await get_session_context(session_id, username)
             
             # Format history for the API
             history_for_api = [
-                {"role": msg["role"], "content": msg["content"]} 
+                {"id": msg["id"], "role": msg["role"], "content": msg["content"]} 
                 for msg in chat_history
             ]
     except Exception as e:
         print(f"Error in chat endpoint setup: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat setup error: {str(e)}")
     
-    # Save the user's message to Supabase
-    user_msg = save_message_to_supabase(session_id, "user", data.user_message)
+    # Ground the reply in the parts of the document relevant to this message
+    document_key = data.document_id
+    if document_text:
+        document_key = DocumentRetriever.text_key(document_text)
+    elif data.document_id and data.include_document_context:
+        doc = await documents_repo.get_document(data.document_id, username, "text")
+        document_text = (doc or {}).get("text") or ""
+    if document_text:
+        document_text = await document_retriever.retrieve(
+            document_key, document_text, data.user_message, settings.PROMPT_DOCUMENT_TOKENS * 4
+        )
+
+    # The user's message is saved together with the reply, in one round trip
+    user_msg = new_message(session_id, "user", data.user_message)
+
+    if data.stream:
+        return StreamingResponse(
+            stream_chat_events(
+                request,
+                username,
+                session_id,
+                is_new_session,
+                user_msg,
+                document_text,
+                history_for_api
+            ),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
 
     # Call OpenRouter to generate a response, providing conversation history
-    response = call_openrouter_model(document_text, data.user_message, history_for_api)
+    try:
+        response = await call_openrouter_model(document_text, data.user_message, history_for_api, session_id)
+    except Exception:
+        # Keep the user's message even when no reply could be generated
+        await save_chat_turn(session_id, [user_msg], username)
+        raise
 
-    # Save the assistant's response to Supabase
-    assistant_msg = save_message_to_supabase(session_id, "assistant", response)
+    # Save both messages and the session preview
+    assistant_msg = new_message(session_id, "assistant", response)
+    await save_chat_turn(session_id, [user_msg, assistant_msg], username)
 
     # Return the response to the client
     return {
         "session_id": session_id,
         "response": response,
-        "user_message_id": user_msg.get("id"),
-        "assistant_message_id": assistant_msg.get("id"),
+        "user_message_id": user_msg["id"],
+        "assistant_message_id": assistant_msg["id"],
         "is_new_session": is_new_session
     }
     
 @router.get("/sessions", response_model=List[Dict[str, Any]])
 async def get_sessions(username: str = Depends(get_current_user)):
     """Get all chat sessions for the current user."""
-    sessions = get_user_chat_sessions(username)
+    sessions = await get_user_chat_sessions(username)
     return sessions
 
 @router.post("/sessions", response_model=Dict[str, Any])
@@ -263,7 +397,7 @@ async def create_session(data: CreateSessionRequest, username: str = Depends(get
         # Use a default title if none provided
         title = data.title if data.title else f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M')}"
         
-        session = create_chat_session(
+        session = await create_chat_session(
             session_id=session_id,
             username=username,
             title=title,
@@ -282,7 +416,7 @@ async def update_session(
 ):
     """Update a chat session (title or end the session)."""
     # Check if the session exists and belongs to the user
-    if not check_session_exists(session_id, username):
+    if not await check_session_exists(session_id, username):
         raise HTTPException(status_code=403, detail="Chat session not found or access denied")
     
     update_data = {}
@@ -294,7 +428,8 @@ async def update_session(
     
     if update_data:
         try:
-            supabase.table("chat_sessions").update(update_data).eq("id", session_id).execute()
+            await chat_repo.update_session(session_id, update_data)
+            invalidate_session(session_id)
             return BaseResponse(
                 success=True,
                 message="Chat session updated successfully",
@@ -310,44 +445,73 @@ async def update_session(
 @router.get("/sessions/{session_id}", response_model=Dict[str, Any])
 async def get_session(session_id: str, username: str = Depends(get_current_user)):
     """Get details of a specific chat session."""
-    # Check if the session exists and belongs to the user
-    if not check_session_exists(session_id, username):
-        raise HTTPException(status_code=403, detail="Chat session not found or access denied")
-    
+    # One fetch serves both the ownership check and the response (and refreshes the cache)
     try:
-        result = supabase.table("chat_sessions").select("*").eq("id", session_id).execute()
-        if not result.data:
-            raise HTTPException(status_code=404, detail="Chat session not found")
-            
-        return result.data[0]
+        session = await chat_repo.get_session(session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve chat session: {e}")
 
+    # Check if the session exists and belongs to the user
+    if not session or session.get("user_id") != username:
+        raise HTTPException(status_code=403, detail="Chat session not found or access denied")
+
+    cache_session(session)
+    return session
+
 @router.get("/sessions/{session_id}/history", response_model=List[Dict[str, Any]])
 async def get_session_history(
     session_id: str, 
-    limit: int = 50, 
-    offset: int = 0,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500), 
+    cursor: Optional[str] = None,
+    offset: int = Query(0, ge=0, deprecated=True),
     username: str = Depends(get_current_user)
 ):
-    """Get chat message history for a specific session."""
+    """Get chat message history for a specific session.
+
+    Pass the X-Next-Cursor response header back as `cursor` to fetch the next page.
+    """
     # Check if the session exists and belongs to the user
-    if not check_session_exists(session_id, username):
+    if not await check_session_exists(session_id, username):
         raise HTTPException(status_code=403, detail="Chat session not found or access denied")
     
-    messages = get_chat_history(session_id, limit, offset)
+    # Kept for older clients; OFFSET re-reads every skipped row
+    if offset:
+        return await get_chat_history(session_id, limit, offset)
+
+    after = parse_history_cursor(cursor)
+    try:
+        # One extra row tells us whether another page exists
+        messages = await chat_repo.list_messages_after(session_id, limit + 1, after)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch chat history: {e}")
+
+    # The last page also includes turns that are journaled but not yet written to the database
+    if len(messages) <= limit:
+        seen = {message["id"] for message in messages}
+        messages += [
+            message for message in chat_journal.pending_messages(session_id)
+            if message["id"] not in seen and (not after or (message["created_at"], message["id"]) > tuple(after))
+        ]
+
+    if len(messages) > limit:
+        messages = messages[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(messages[-1], HISTORY_CURSOR_FIELDS)
     return messages
 
 @router.delete("/sessions/{session_id}", response_model=BaseResponse)
 async def delete_session(session_id: str, username: str = Depends(get_current_user)):
     """Delete a chat session and all its messages."""
     # Check if the session exists and belongs to the user
-    if not check_session_exists(session_id, username):
+    if not await check_session_exists(session_id, username):
         raise HTTPException(status_code=403, detail="Chat session not found or access denied")
     
     try:
         # Delete the session (cascading delete will handle messages due to foreign key)
-        supabase.table("chat_sessions").delete().eq("id", session_id).execute()
+        chat_journal.discard_session(session_id)
+        await chat_repo.delete_session(session_id)
+        invalidate_session(session_id)
+        search_index.remove_session(username, session_id)
         
         return BaseResponse(
             success=True,
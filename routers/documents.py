@@ -1,82 +1,230 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from uuid import uuid4
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks, Query, Response
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
-import os, shutil
-from db import supabase
-import pytesseract
-from PIL import Image
+import os, hashlib, uuid
+from config import settings
+from repositories import documents as documents_repo
 from fastapi.responses import JSONResponse
 from middleware.auth import get_current_user
-from utils.medical_extractor import MedicalExtractor
-import PyPDF2
-from io import BytesIO
+from middleware.upload_limit import upload_too_large_detail
+from utils.document_processor import document_processor, DocumentStatus
+from utils.document_cache import document_cache
+from utils.search_index import search_index
+from utils.pagination import encode_cursor, decode_cursor
 
 router = APIRouter()
 
-UPLOAD_FOLDER = "uploads"
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
 
-@router.post("/upload")
-async def upload_document(file: UploadFile = File(...), username: str = Depends(get_current_user)):
-    try:
-        # Ensure uploads/ folder exists
-        UPLOAD_FOLDER = "uploads"
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-        # Save file locally
-        ext = file.filename.split(".")[-1]
-        filename = f"{uuid4()}.{ext}"
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # OCR extraction
-        if ext.lower() in ["png", "jpg", "jpeg"]:
-            img = Image.open(file_path)
-            extracted_text = pytesseract.image_to_string(img)
-        elif ext.lower() == "pdf":
-            # Read PDF
-            try:
-                with open(file_path, "rb") as pdf_file:
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-                    text_parts = []
-                    for page in pdf_reader.pages:
-                        text_parts.append(page.extract_text())
-                    extracted_text = "\n".join(text_parts)
-            except Exception as e:
-                raise HTTPException(500, detail=f"Error processing PDF: {str(e)}")
-        else:
-            raise HTTPException(400, detail="Unsupported file type")
-        
-        # Extract medical information
-        medical_info = MedicalExtractor.extract_all_medical_info(extracted_text)
-
-        # Save to Supabase
-        doc_data = {
-            "user_id": username,
-            "filename": filename,
-            "text": extracted_text,
-            "medical_data": medical_info,
-            "processed_at": "now()",
-            "file_type": ext.lower()
-        }
-        
-        result = supabase.table("documents").insert(doc_data).execute()
+# Columns a listing may select; text is only returned by GET /docs/{document_id}
+DOCUMENT_LIST_FIELDS = (
+    "id", "filename", "file_type", "content_hash", "status", "error",
+    "medical_data", "processing_stats", "processed_at", "created_at"
+)
+DEFAULT_LIST_FIELDS = ("id", "filename", "file_type", "status", "processed_at", "created_at")
+LIST_CURSOR_FIELDS = ["created_at", "id"]
+
+async def read_upload(file: UploadFile) -> Tuple[bytes, str]:
+    """Read an upload in chunks, enforcing the size limit and hashing the content as it streams"""
+    if file.size is not None and file.size > settings.MAX_FILE_SIZE:
+        raise HTTPException(413, detail=upload_too_large_detail())
+
+    digest = hashlib.sha256()
+    chunks = []
+    total = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > settings.MAX_FILE_SIZE:
+            raise HTTPException(413, detail=upload_too_large_detail())
+        digest.update(chunk)
+        chunks.append(chunk)
+
+    if total == 0:
+        raise HTTPException(400, detail="Uploaded file is empty")
+
+    return b"".join(chunks), digest.hexdigest()
+
+@router.post("/upload", status_code=202)
+async def upload_document(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    username: str = Depends(get_current_user)
+):
+    """Read an upload into memory and queue it for OCR/parsing; poll /docs/{document_id}/status for the result.
+
+    Re-uploads of previously processed content are answered immediately from the document cache.
+    """
+    filename = os.path.basename(file.filename or "")
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in settings.ALLOWED_EXTENSIONS:
+        raise HTTPException(400, detail="Unsupported file type")
+    file_type = ext.lstrip(".")
+
+    data, content_hash = await read_upload(file)
+
+    # Identical bytes were processed before: reuse the cached extraction
+    cached = document_cache.get(content_hash)
+    if cached is not None:
+        try:
+            doc = await documents_repo.insert_document({
+                "user_id": username,
+                "filename": filename[:255],
+                "file_type": file_type,
+                "content_hash": content_hash,
+                "text": cached["text"],
+                "medical_data": cached["medical_data"],
+                "processing_stats": {**(cached["processing_stats"] or {}), "cache_hit": True},
+                "status": DocumentStatus.DONE,
+                "processed_at": "now()"
+            })
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        if doc:
+            search_index.add_document(username, doc)
 
-        # Get the document ID from the result
-        doc_id = result.data[0]["id"] if result.data else None
-        
         return JSONResponse(content={
             "message": "Uploaded & processed",
-            "document_id": doc_id,
+            "document_id": doc["id"] if doc else None,
             "filename": filename,
-            "extracted_text": extracted_text[:500],
-            "medical_info": medical_info
+            "content_hash": content_hash,
+            "status": DocumentStatus.DONE,
+            "extracted_text": cached["text"][:500],
+            "medical_info": cached["medical_data"]
         })
 
+    if not document_processor.has_capacity():
+        raise HTTPException(503, detail="Document processing queue is full. Please retry shortly.")
+    # Take the slot before awaiting the insert so concurrent uploads cannot overshoot the limit
+    document_processor.reserve()
+
+    try:
+        # Record the document straight away; text and medical data are filled in by the worker
+        doc_data = {
+            "user_id": username,
+            "filename": filename[:255],
+            "file_type": file_type,
+            "content_hash": content_hash,
+            "status": DocumentStatus.QUEUED,
+            "processed_at": None
+        }
+
+        doc = await documents_repo.insert_document(doc_data)
+
+        # Get the document ID from the result
+        doc_id = doc["id"] if doc else None
+        if not doc_id:
+            raise HTTPException(500, detail="Failed to record document")
+    except HTTPException:
+        document_processor.release()
+        raise
     except Exception as e:
+        document_processor.release()
         raise HTTPException(status_code=500, detail=str(e))
-@router.get("/all")
-def get_all_documents(username: str = Depends(get_current_user)):
-    docs = supabase.table("documents").select("*").eq("user_id", username).execute().data
+
+    background_tasks.add_task(document_processor.process, doc_id, data, file_type, content_hash, username, filename[:255])
+
+    return JSONResponse(status_code=202, content={
+        "message": "Uploaded, processing queued",
+        "document_id": doc_id,
+        "filename": filename,
+        "content_hash": content_hash,
+        "status": DocumentStatus.QUEUED
+    })
+
+@router.get("/{document_id}/status")
+async def get_document_status(document_id: str, username: str = Depends(get_current_user)):
+    """Get the processing status of an uploaded document, with its results once done"""
+    doc = await documents_repo.get_document(
+        document_id,
+        username,
+        "id, filename, status, error, text, medical_data, processing_stats, processed_at"
+    )
+
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    response = {
+        "document_id": doc["id"],
+        "filename": doc["filename"],
+        "status": doc.get("status") or DocumentStatus.DONE
+    }
+    if response["status"] == DocumentStatus.DONE:
+        response["extracted_text"] = (doc.get("text") or "")[:500]
+        response["medical_info"] = doc.get("medical_data")
+        response["processing_stats"] = doc.get("processing_stats")
+        response["processed_at"] = doc.get("processed_at")
+    elif response["status"] == DocumentStatus.FAILED:
+        response["error"] = doc.get("error")
+    return response
+
+def parse_list_fields(fields: Optional[str]) -> str:
+    """Validate a comma-separated field selection; the cursor fields are always included"""
+    if not fields:
+        selected = list(DEFAULT_LIST_FIELDS)
+    else:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = sorted(set(selected) - set(DOCUMENT_LIST_FIELDS))
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(DOCUMENT_LIST_FIELDS)}"
+            )
+    for field in LIST_CURSOR_FIELDS:
+        if field not in selected:
+            selected.append(field)
+    return ", ".join(dict.fromkeys(selected))
+
+def parse_list_cursor(cursor: Optional[str]) -> Optional[List[str]]:
+    """Decode a listing cursor into its (created_at, id) position"""
+    position = decode_cursor(cursor, len(LIST_CURSOR_FIELDS))
+    if position is None:
+        return None
+    try:
+        datetime.fromisoformat(position[0])
+        uuid.UUID(position[1])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+@router.get("/list", response_model=List[Dict[str, Any]])
+async def list_documents(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return (default: metadata only)"),
+    username: str = Depends(get_current_user)
+):
+    """List the user's documents, newest first, without their extracted text.
+
+    Pass the X-Next-Cursor response header back as `cursor` to fetch the next page.
+    """
+    columns = parse_list_fields(fields)
+    before = parse_list_cursor(cursor)
+    try:
+        # One extra row tells us whether another page exists
+        docs = await documents_repo.list_documents_page(username, columns, limit + 1, before)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list documents: {e}")
+
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1], LIST_CURSOR_FIELDS)
+    return docs
+
+@router.get("/all", deprecated=True)
+async def get_all_documents(username: str = Depends(get_current_user)):
+    """Every document with its full text; use /docs/list and /docs/{document_id} instead"""
+    docs = await documents_repo.list_documents(username)
     return docs
+
+@router.get("/{document_id}")
+async def get_document(document_id: str, username: str = Depends(get_current_user)):
+    """Get one document, including its extracted text and medical data"""
+    doc = await documents_repo.get_document(document_id, username)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
 from models.responses import BaseResponse
 from middleware.auth import get_current_user
-from db import supabase
+from middleware.user_context import UserContext, get_user_context
+from models.users import UserRole
+from repositories import documents as documents_repo, medical as medical_repo
+from utils.summary_context import (
+    gather_summary_sources, has_changes, next_watermark, build_history_context, build_profile_context
+)
+from utils.retrieval import document_retriever
+from utils.response_cache import response_cache, normalize_symptoms, duration_bucket, text_hash
 from pydantic import BaseModel
 from typing import List, Optional
 import os
-import json
-import requests
 from uuid import uuid4
 
 router = APIRouter()
@@ -23,18 +28,15 @@ class DiagnosticQuestion(BaseModel):
     context: str
 
 @router.post("/analyze-symptoms", response_model=BaseResponse)
-async def analyze_symptoms(request: MedicalAnalysisRequest, username: str = Depends(get_current_user)):
+async def analyze_symptoms(request: MedicalAnalysisRequest, context: UserContext = Depends(get_user_context)):
     """Analyze symptoms and provide diagnostic guidance"""
-    
-    # Get user information to provide context
-    user = supabase.table("users").select("*").eq("username", username).execute().data[0]
+    username = context.username
     
     # Get patient profile if exists
     medical_context = ""
-    if user["role"] == "patient":
-        patient_profile = supabase.table("patient_profiles").select("*").eq("user_id", user["id"]).execute()
-        if patient_profile.data:
-            profile = patient_profile.data[0]
+    if context.role == UserRole.PATIENT:
+        profile = await context.get_profile()
+        if profile:
             if profile.get("medical_history"):
                 medical_context += f"Medical History: {profile['medical_history']}\n"
             if profile.get("allergies"):
@@ -45,23 +47,32 @@ async def analyze_symptoms(request: MedicalAnalysisRequest, username: str = Depe
     # Get the document text if a document ID was provided
     document_text = ""
     if request.document_id:
-        doc = supabase.table("documents").select("*").eq("id", request.document_id).eq("user_id", username).execute()
-        if doc.data:
-            document_text = doc.data[0].get("text", "")
+        doc = await documents_repo.get_document(request.document_id, username, "text")
+        if doc:
+            document_text = doc.get("text") or ""
     
+    # The prompt is built from canonical inputs so equivalent requests share a cache entry
+    symptoms = normalize_symptoms(request.symptoms)
+    duration = duration_bucket(request.duration)
+    notes = (request.additional_notes or "").strip()
+    # Use the parts of the document most relevant to the symptoms rather than its first page
+    document_excerpt = await document_retriever.retrieve(
+        request.document_id, document_text, " ".join(symptoms + [notes]), 1000
+    ) if document_text else ""
+
     # Prepare the prompt for medical analysis
     prompt = f"""
 As an AI Health Assistant, please analyze the following symptoms:
-- {', '.join(request.symptoms)}
+- {', '.join(symptoms)}
 
 Additional information:
-- Duration: {request.duration or 'Not specified'} days
+- Duration: {duration or 'Not specified'} days
 - Severity (1-10): {request.severity or 'Not specified'}
-- Additional notes: {request.additional_notes or 'None'}
+- Additional notes: {notes or 'None'}
 
 {medical_context if medical_context else ''}
 
-{f"Relevant medical document: {document_text[:500]}..." if document_text else ''}
+{f"Relevant medical document: {document_excerpt[:500]}..." if document_excerpt else ''}
 
 Based on the information provided:
 1. What are the possible conditions that might explain these symptoms?
@@ -77,24 +88,36 @@ IMPORTANT DISCLAIMER: This is an AI analysis and should not replace professional
     from routers.chat import call_openrouter_model
     
     try:
-        analysis = call_openrouter_model(document_text[:1000] if document_text else "", prompt)
+        analysis, cache_hit = await response_cache.get_or_generate(
+            "analyze-symptoms",
+            {
+                "symptoms": symptoms,
+                "duration": duration,
+                "severity": request.severity,
+                "notes": text_hash(notes),
+                "profile": text_hash(medical_context),
+                "document": text_hash(document_excerpt)
+            },
+            lambda: call_openrouter_model(document_excerpt, prompt)
+        )
         
-        # Save analysis to database
+        # Save analysis to database (cache hits too, so each request gets its own analysis_id)
         analysis_id = str(uuid4())
-        supabase.table("medical_analyses").insert({
+        await medical_repo.insert_analysis({
             "id": analysis_id,
             "user_id": username,
             "symptoms": request.symptoms,
             "analysis": analysis,
             "document_id": request.document_id
-        }).execute()
+        })
         
         return BaseResponse(
             success=True,
             message="Symptoms analyzed successfully",
             data={
                 "analysis_id": analysis_id,
-                "analysis": analysis
+                "analysis": analysis,
+                "cached": cache_hit
             }
         )
         
@@ -106,12 +129,12 @@ async def generate_follow_up_questions(analysis_id: str, username: str = Depends
     """Generate follow-up questions based on a previous analysis"""
     
     # Get the analysis
-    analysis = supabase.table("medical_analyses").select("*").eq("id", analysis_id).eq("user_id", username).execute()
+    analysis = await medical_repo.get_analysis(analysis_id, username)
     
-    if not analysis.data:
+    if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
-    analysis_text = analysis.data[0].get("analysis", "")
+    analysis_text = analysis.get("analysis", "")
     
     prompt = f"""
 Based on the previous medical analysis:
@@ -126,13 +149,18 @@ These questions should be specific and help gather clinically relevant informati
     from routers.chat import call_openrouter_model
     
     try:
-        questions = call_openrouter_model("", prompt)
+        questions, cache_hit = await response_cache.get_or_generate(
+            "follow-up-questions",
+            {"analysis": text_hash(analysis_text)},
+            lambda: call_openrouter_model("", prompt)
+        )
         
         return BaseResponse(
             success=True,
             message="Follow-up questions generated successfully",
             data={
-                "questions": questions
+                "questions": questions,
+                "cached": cache_hit
             }
         )
         
@@ -140,56 +168,63 @@ These questions should be specific and help gather clinically relevant informati
         raise HTTPException(status_code=500, detail=f"Failed to generate follow-up questions: {str(e)}")
 
 @router.post("/summarize-history", response_model=BaseResponse)
-async def summarize_medical_history(username: str = Depends(get_current_user)):
+async def summarize_medical_history(context: UserContext = Depends(get_user_context)):
     """Summarize patient's medical history from documents and past analyses"""
+    username = context.username
     
-    # Get all documents
-    documents = supabase.table("documents").select("*").eq("user_id", username).execute().data
-    
-    # Get all analyses
-    analyses = supabase.table("medical_analyses").select("*").eq("user_id", username).execute().data
-    
-    # Get patient profile
-    user = supabase.table("users").select("*").eq("username", username).execute().data[0]
-    patient_profile = None
-    if user["role"] == "patient":
-        profile_data = supabase.table("patient_profiles").select("*").eq("user_id", user["id"]).execute().data
-        if profile_data:
-            patient_profile = profile_data[0]
-    
-    # Prepare context for summarization
-    document_texts = []
-    for doc in documents:
-        text = doc.get("text", "")
-        if text:
-            document_texts.append(text[:500])  # Take first 500 chars of each document
-    
-    analysis_texts = []
-    for analysis in analyses:
-        analysis_text = analysis.get("analysis", "")
-        if analysis_text:
-            analysis_texts.append(analysis_text[:500])  # Take first 500 chars of each analysis
-    
-    context = "\n\n".join(document_texts + analysis_texts)
-    
-    # Add profile information if available
-    profile_context = ""
-    if patient_profile:
-        if patient_profile.get("medical_history"):
-            profile_context += f"Self-reported medical history: {patient_profile['medical_history']}\n"
-        if patient_profile.get("allergies"):
-            profile_context += f"Allergies: {patient_profile['allergies']}\n"
-        if patient_profile.get("current_medications"):
-            profile_context += f"Current medications: {patient_profile['current_medications']}\n"
+    # Only documents and analyses newer than the latest summary's watermark are fetched
+    latest = await medical_repo.get_latest_summary(username)
+    watermark = latest.get("watermark") if latest else None
+    sources = await gather_summary_sources(context, watermark)
+
+    # Nothing new since the last summary: reuse it instead of calling the model again
+    if watermark and not has_changes(watermark, sources):
+        return BaseResponse(
+            success=True,
+            message="Medical history summary is up to date",
+            data={
+                "summary_id": latest["id"],
+                "summary": latest["summary"],
+                "incremental": False,
+                "reused": True
+            }
+        )
+
+    # Only what fits in the prompt is summarized now; the watermark stops there
+    history_context, used_documents, used_analyses = build_history_context(sources["documents"], sources["analyses"])
+    pending = len(sources["documents"]) - len(used_documents) + len(sources["analyses"]) - len(used_analyses)
+    profile_context = build_profile_context(sources["profile"])
     
     # Generate summary prompt
-    prompt = f"""
+    if watermark:
+        prompt = f"""
+As a medical AI assistant, please update the existing summary of the patient's medical history with the new information below.
+
+Existing summary:
+{latest["summary"]}
+
+{profile_context}
+
+New documents and consultations since the existing summary:
+{history_context or 'None'}
+
+Keep everything in the existing summary that is still accurate and integrate the new information. Please provide:
+1. A chronological summary of key medical events
+2. Consistent symptoms or complaints
+3. Any diagnosed conditions
+4. Current medications and treatments
+5. Areas that may require follow-up or clarification
+
+This summary should help healthcare providers quickly understand the patient's medical background.
+    """
+    else:
+        prompt = f"""
 As a medical AI assistant, please create a comprehensive summary of the patient's medical history based on the following information:
 
 {profile_context}
 
 Documents and past consultations:
-{context[:3000]}  # Limit to avoid token limits
+{history_context}
 
 Please provide:
 1. A chronological summary of key medical events
@@ -205,22 +240,27 @@ This summary should help healthcare providers quickly understand the patient's m
     from routers.chat import call_openrouter_model
     
     try:
-        summary = call_openrouter_model("", prompt)
+        summary = await call_openrouter_model("", prompt)
         
         # Save summary to database
         summary_id = str(uuid4())
-        supabase.table("medical_summaries").insert({
+        await medical_repo.insert_summary({
             "id": summary_id,
             "user_id": username,
-            "summary": summary
-        }).execute()
+            "summary": summary,
+            "watermark": next_watermark(watermark, {**sources, "documents": used_documents, "analyses": used_analyses})
+        })
         
         return BaseResponse(
             success=True,
             message="Medical history summarized successfully",
             data={
                 "summary_id": summary_id,
-                "summary": summary
+                "summary": summary,
+                "incremental": bool(watermark),
+                "reused": False,
+                # Documents/analyses left for the next call, when more were new than fit in one prompt
+                "pending": pending
             }
         )
         
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, Query
+from typing import List, Optional
+import time
+from middleware.auth import get_current_user
+from utils.search_index import search_index
+
+router = APIRouter()
+
+SEARCH_TYPES = {"document", "message"}
+
+@router.get("")
+async def search(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    types: Optional[List[str]] = Query(None, description="Restrict to 'document' and/or 'message'"),
+    username: str = Depends(get_current_user)
+):
+    """Search your documents (text and extracted medical data) and chat messages"""
+    started = time.perf_counter()
+    selected = [t for t in types if t in SEARCH_TYPES] if types else None
+    results = await search_index.search(username, q, limit, selected)
+    return {
+        "query": q,
+        "results": results,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
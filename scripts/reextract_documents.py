@@ -0,0 +1,38 @@
+"""Re-derive documents.medical_data for every stored document.
+
+Usage:
+    python -m scripts.reextract_documents [--batch-size 500] [--workers N] [--restart]
+
+Progress is checkpointed after every batch, so an interrupted run picks up
+where it left off unless --restart is given.
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import settings  # noqa: E402
+from utils.batch_reextract import ReextractionJob  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=settings.REEXTRACT_BATCH_SIZE, help="rows fetched and updated per batch")
+    parser.add_argument("--workers", type=int, default=settings.OCR_WORKERS, help="extraction worker processes")
+    parser.add_argument("--checkpoint", default=settings.REEXTRACT_CHECKPOINT_PATH, help="checkpoint file path")
+    parser.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    job = ReextractionJob(batch_size=args.batch_size, workers=args.workers, checkpoint_path=args.checkpoint)
+    try:
+        status = job.run(resume=not args.restart)
+    except KeyboardInterrupt:
+        print(f"Interrupted; resume later from checkpoint {args.checkpoint}")
+        sys.exit(130)
+    print(f"Re-extracted {status['processed']} documents ({status['rows_per_second']} rows/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Routing tests for utils.llm_backends, run with: python -m unittest discover tests"""
+import sys
+import unittest
+from pathlib import Path
+from typing import Any, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.llm_backends import LLMRouter, LocalStubBackend  # noqa: E402
+
+PAYLOAD = {"messages": [{"role": "user", "content": "What does my blood test mean?"}]}
+
+class FlakyBackend(LocalStubBackend):
+    """Local stub that raises while it is down"""
+
+    def __init__(self, name: str):
+        super().__init__(name=name)
+        self.down = False
+
+    async def complete(self, payload: Dict[str, Any]) -> str:
+        if self.down:
+            raise RuntimeError(f"{self.name} is down")
+        return await super().complete(payload)
+
+def make_router(primary: LocalStubBackend, probe_seconds: float) -> LLMRouter:
+    return LLMRouter(
+        # The fallback is slower, so latency ranking prefers a healthy primary
+        [primary, LocalStubBackend(name="fallback", delay=0.005)],
+        window=10,
+        min_samples=3,
+        max_error_rate=0.5,
+        explore_rate=0.0,
+        probe_seconds=probe_seconds
+    )
+
+class LocalStubBackendTest(unittest.IsolatedAsyncioTestCase):
+    async def test_reply_is_deterministic(self):
+        backend = LocalStubBackend()
+        first = await backend.complete(PAYLOAD)
+        self.assertEqual(first, await backend.complete(PAYLOAD))
+        self.assertEqual(first, "".join([delta async for delta in backend.stream(PAYLOAD)]))
+
+class LLMRouterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_fails_over_while_primary_is_down(self):
+        primary = FlakyBackend("primary")
+        router = make_router(primary, probe_seconds=3600)
+        primary.down = True
+
+        for _ in range(5):
+            self.assertTrue((await router.complete(PAYLOAD)).startswith("[fallback "))
+        self.assertFalse(router.stats()["backends"]["primary"]["healthy"])
+        self.assertEqual(router.stats()["order"], ["fallback", "primary"])
+
+    async def test_unhealthy_backend_recovers_through_probe(self):
+        primary = FlakyBackend("primary")
+        router = make_router(primary, probe_seconds=0)
+        primary.down = True
+        for _ in range(12):
+            await router.complete(PAYLOAD)
+        self.assertFalse(router.stats()["backends"]["primary"]["healthy"])
+
+        primary.down = False
+        replies = [await router.complete(PAYLOAD) for _ in range(5)]
+
+        self.assertTrue(all(reply.startswith("[primary ") for reply in replies))
+        stats = router.stats()["backends"]["primary"]
+        self.assertTrue(stats["healthy"])
+        self.assertEqual(stats["error_rate"], 0.0)
+
+    async def test_probe_waits_for_interval(self):
+        primary = FlakyBackend("primary")
+        router = make_router(primary, probe_seconds=3600)
+        primary.down = True
+        for _ in range(3):
+            await router.complete(PAYLOAD)
+
+        # First ranking after the backend turned unhealthy probes it; the next ones don't
+        self.assertEqual(router.ranked()[0].name, "primary")
+        self.assertEqual(router.ranked()[0].name, "fallback")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from db import supabase
+from utils.medical_extractor import MedicalExtractor
+
+logger = logging.getLogger(__name__)
+
+class ReextractionJob:
+    """Re-derives documents.medical_data with the current MedicalExtractor.
+
+    Rows are paged by id (keyset pagination), extracted across a process pool
+    and written back with one update per batch. After every batch the last id
+    is checkpointed to disk, so an interrupted run resumes where it stopped.
+    A checkpoint written by a different extractor version is ignored.
+    """
+
+    def __init__(self, batch_size: int, workers: int, checkpoint_path: Optional[str] = None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint_path = checkpoint_path
+        self.status: Dict[str, Any] = {"state": "idle"}
+        self._stop = threading.Event()
+
+    def _load_checkpoint(self) -> Optional[str]:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.checkpoint_path}: {e}")
+            return None
+        if checkpoint.get("extractor_version") != MedicalExtractor.VERSION:
+            logger.info("Checkpoint was written by a different extractor version; starting over")
+            return None
+        return checkpoint.get("last_id")
+
+    def _save_checkpoint(self, last_id: str, processed: int):
+        if not self.checkpoint_path:
+            return
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "last_id": last_id,
+                "processed": processed,
+                "extractor_version": MedicalExtractor.VERSION,
+                "updated_at": time.time()
+            }, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _fetch_batch(self, after_id: Optional[str]) -> List[Dict[str, Any]]:
+        query = supabase.table("documents") \
+            .select("id, text") \
+            .not_.is_("text", "null") \
+            .order("id") \
+            .limit(self.batch_size)
+        if after_id:
+            query = query.gt("id", after_id)
+        return query.execute().data
+
+    def stop(self):
+        """Ask a running job to stop after the current batch"""
+        self._stop.set()
+
+    def run(self, resume: bool = True, progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Process every document, returning the final status"""
+        self._stop.clear()
+        last_id = self._load_checkpoint() if resume else None
+        processed = 0
+        started = time.perf_counter()
+        self.status = {"state": "running", "processed": 0, "rows_per_second": 0.0, "last_id": last_id}
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                while not self._stop.is_set():
+                    rows = self._fetch_batch(last_id)
+                    if not rows:
+                        break
+
+                    chunksize = max(1, len(rows) // (self.workers * 4))
+                    medical_data = pool.map(
+                        MedicalExtractor.extract_all_medical_info,
+                        [row["text"] for row in rows],
+                        chunksize=chunksize
+                    )
+                    # Update only (update_documents_medical_data), so rows deleted meanwhile are not recreated
+                    updates = [{"id": row["id"], "medical_data": data} for row, data in zip(rows, medical_data)]
+                    supabase.rpc("update_documents_medical_data", {"p_updates": updates}).execute()
+
+                    processed += len(rows)
+                    last_id = rows[-1]["id"]
+                    self._save_checkpoint(last_id, processed)
+
+                    elapsed = time.perf_counter() - started
+                    self.status = {
+                        "state": "running",
+                        "processed": processed,
+                        "rows_per_second": round(processed / elapsed, 1) if elapsed else 0.0,
+                        "last_id": last_id
+                    }
+                    logger.info(
+                        f"Re-extracted {processed} documents ({self.status['rows_per_second']} rows/s)"
+                    )
+                    if progress:
+                        progress(self.status)
+        except Exception as e:
+            logger.error(f"Re-extraction failed after {processed} documents: {e}")
+            self.status = {**self.status, "state": "failed", "error": str(e)}
+            raise
+
+        if self._stop.is_set():
+            self.status = {**self.status, "state": "stopped"}
+        else:
+            # Nothing left to resume once a run completes
+            if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            self.status = {**self.status, "state": "done"}
+        return self.status
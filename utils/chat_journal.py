@@ -0,0 +1,385 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from postgrest.exceptions import APIError
+
+from config import settings
+from repositories import chat as chat_repo
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between retries of a turn that keeps failing
+MAX_RETRY_SECONDS = 300
+
+def is_permanent_error(error: BaseException) -> bool:
+    """Whether retrying a failed save cannot help: invalid data, a constraint
+    violation (e.g. the session was deleted) or a row-level security rejection.
+    Timeouts, network errors and a missing save_chat_turn function are retried.
+    """
+    code = getattr(error, "code", None) if isinstance(error, APIError) else None
+    return bool(code) and (code[:2] in ("22", "23") or code == "42501")
+
+class ChatJournal:
+    """Write-behind buffer for chat turns.
+
+    A turn is acknowledged once it is appended to a local SQLite journal;
+    a background task then writes journaled turns to the database in
+    batches (one save_chat_turn call per session) and removes them from the
+    journal. The save is idempotent on message id, so a turn written just
+    before a crash is not duplicated when it is replayed.
+
+    Each process owns one journal file (a numbered slot next to path,
+    claimed with a file lock), so only the process that keeps a turn's
+    pending messages in memory flushes it. At startup a process also
+    adopts the files of slots no running process holds.
+
+    A session whose save fails is retried with backoff while other sessions
+    keep flushing. Turns that fail permanently max_attempts times are moved
+    to a dead-letter table instead of being retried forever.
+    """
+
+    def __init__(self, path: str, batch_size: int, flush_interval: float, retry_seconds: float, max_attempts: int):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_seconds = retry_seconds
+        self.max_attempts = max_attempts
+        self.flushed = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.slot_path: Optional[str] = None
+        self._slot_lock = None
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _slot_file(self, slot: int) -> str:
+        base, ext = os.path.splitext(self.path)
+        return f"{base}-{slot}{ext}"
+
+    @staticmethod
+    def _try_lock(journal_path: str):
+        """Exclusive, non-blocking lock on a slot; released automatically if the process dies"""
+        handle = open(journal_path + ".lock", "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+        return handle
+
+    def _claim_slot(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        slot = 0
+        while True:
+            handle = self._try_lock(self._slot_file(slot))
+            if handle is not None:
+                self._slot_lock = handle
+                self.slot_path = self._slot_file(slot)
+                return
+            slot += 1
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Every acknowledged turn must survive a crash
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                messages TEXT NOT NULL,
+                last_message TEXT,
+                appended_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_journal_dead (
+                seq INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                messages TEXT NOT NULL,
+                last_message TEXT,
+                appended_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                error TEXT,
+                failed_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        return conn
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.slot_path is None:
+                self._claim_slot()
+            self._conn = self._connect(self.slot_path)
+        return self._conn
+
+    def _adopt_orphans(self) -> int:
+        """Move turns from journal files whose process is gone into this process's journal"""
+        with self._lock:
+            self._get_conn()
+        base, ext = os.path.splitext(self.path)
+        pattern = re.compile(re.escape(base) + r"-\d+" + re.escape(ext) + "$")
+        adopted = 0
+        for path in glob.glob(f"{glob.escape(base)}-*{ext}"):
+            if path == self.slot_path or not pattern.search(path):
+                continue
+            handle = self._try_lock(path)
+            if handle is None:
+                continue  # Owned by a running process
+            try:
+                orphan = self._connect(path)
+                rows = orphan.execute(
+                    "SELECT session_id, messages, last_message, appended_at FROM chat_journal ORDER BY seq"
+                ).fetchall()
+                dead = orphan.execute(
+                    "SELECT seq, session_id, messages, last_message, appended_at, attempts, error, failed_at "
+                    "FROM chat_journal_dead"
+                ).fetchall()
+                with self._lock:
+                    conn = self._get_conn()
+                    conn.executemany(
+                        "INSERT INTO chat_journal (session_id, messages, last_message, appended_at) VALUES (?, ?, ?, ?)",
+                        rows
+                    )
+                    conn.executemany(
+                        "INSERT INTO chat_journal_dead (session_id, messages, last_message, appended_at, attempts, error, failed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [row[1:] for row in dead]
+                    )
+                    conn.commit()
+                orphan.execute("DELETE FROM chat_journal")
+                orphan.execute("DELETE FROM chat_journal_dead")
+                orphan.commit()
+                orphan.close()
+                adopted += len(rows)
+            finally:
+                handle.close()
+        return adopted
+
+    def _write(self, session_id: str, messages: List[Dict[str, Any]], last_message: Optional[str]):
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT INTO chat_journal (session_id, messages, last_message, appended_at) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(messages), last_message, time.time())
+            )
+            conn.commit()
+
+    def _read_all(self) -> List[tuple]:
+        with self._lock:
+            # A restart retries deferred turns straight away
+            self._get_conn().execute("UPDATE chat_journal SET next_attempt_at = 0")
+            self._conn.commit()
+            return self._conn.execute(
+                "SELECT seq, session_id, messages, last_message FROM chat_journal ORDER BY seq"
+            ).fetchall()
+
+    def _read_due(self, limit: int) -> List[tuple]:
+        """Oldest turns that are due, skipping sessions that have a turn waiting to be retried"""
+        now = time.time()
+        with self._lock:
+            return self._get_conn().execute(
+                "SELECT seq, session_id, messages, last_message, attempts FROM chat_journal "
+                "WHERE next_attempt_at <= ? AND session_id NOT IN "
+                "(SELECT session_id FROM chat_journal WHERE next_attempt_at > ?) "
+                "ORDER BY seq LIMIT ?",
+                (now, now, int(limit))
+            ).fetchall()
+
+    def _delete(self, seqs: List[int]):
+        with self._lock:
+            conn = self._get_conn()
+            conn.executemany("DELETE FROM chat_journal WHERE seq = ?", [(seq,) for seq in seqs])
+            conn.commit()
+
+    def _defer(self, seqs: List[int], attempts: int):
+        delay = min(self.retry_seconds * 2 ** (attempts - 1), MAX_RETRY_SECONDS)
+        with self._lock:
+            conn = self._get_conn()
+            conn.executemany(
+                "UPDATE chat_journal SET attempts = ?, next_attempt_at = ? WHERE seq = ?",
+                [(attempts, time.time() + delay, seq) for seq in seqs]
+            )
+            conn.commit()
+
+    def _dead_letter(self, seqs: List[int], attempts: int, error: str):
+        with self._lock:
+            conn = self._get_conn()
+            conn.executemany(
+                "INSERT INTO chat_journal_dead (seq, session_id, messages, last_message, appended_at, attempts, error, failed_at) "
+                "SELECT seq, session_id, messages, last_message, appended_at, ?, ?, ? FROM chat_journal WHERE seq = ?",
+                [(attempts, error, time.time(), seq) for seq in seqs]
+            )
+            conn.executemany("DELETE FROM chat_journal WHERE seq = ?", [(seq,) for seq in seqs])
+            conn.commit()
+
+    def _track(self, session_id: str, messages: List[Dict[str, Any]]):
+        self._pending.setdefault(session_id, []).extend(messages)
+
+    def _untrack(self, session_id: str, messages: List[Dict[str, Any]]):
+        ids = {message["id"] for message in messages}
+        remaining = [message for message in self._pending.get(session_id, []) if message["id"] not in ids]
+        if remaining:
+            self._pending[session_id] = remaining
+        else:
+            self._pending.pop(session_id, None)
+
+    async def append(self, session_id: str, messages: List[Dict[str, Any]], last_message: Optional[str] = None):
+        """Durably record a turn; it is written to the database in the background"""
+        await asyncio.to_thread(self._write, session_id, messages, last_message)
+        self._track(session_id, messages)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending_messages(self, session_id: str) -> List[Dict[str, Any]]:
+        """Messages of a session that are journaled but not yet in the database, oldest first"""
+        return [{**message, "session_id": session_id} for message in self._pending.get(session_id, [])]
+
+    def discard_session(self, session_id: str):
+        """Drop unflushed turns of a session that is being deleted"""
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("DELETE FROM chat_journal WHERE session_id = ?", (session_id,))
+            conn.commit()
+        self._pending.pop(session_id, None)
+
+    async def flush(self) -> int:
+        """Write one batch of due turns to the database; returns how many turns were read"""
+        rows = await asyncio.to_thread(self._read_due, self.batch_size)
+        if not rows:
+            return 0
+
+        # Turns of the same session are written together, in journal order
+        batches: Dict[str, Dict[str, Any]] = {}
+        for seq, session_id, messages, last_message, attempts in rows:
+            batch = batches.setdefault(session_id, {"seqs": [], "messages": [], "last_message": None, "attempts": 0})
+            batch["seqs"].append(seq)
+            batch["messages"].extend(json.loads(messages))
+            batch["attempts"] = max(batch["attempts"], attempts)
+            if last_message is not None:
+                batch["last_message"] = last_message
+
+        session_ids = list(batches)
+        results = await asyncio.gather(*(
+            chat_repo.save_chat_turn(session_id, batches[session_id]["messages"], batches[session_id]["last_message"])
+            for session_id in session_ids
+        ), return_exceptions=True)
+
+        done: List[int] = []
+        for session_id, result in zip(session_ids, results):
+            batch = batches[session_id]
+            if not isinstance(result, BaseException):
+                done.extend(batch["seqs"])
+                self.flushed += len(batch["messages"])
+                self._untrack(session_id, batch["messages"])
+                continue
+
+            self.failures += 1
+            attempts = batch["attempts"] + 1
+            if is_permanent_error(result) and attempts >= self.max_attempts:
+                logger.error(
+                    f"Dead-lettering {len(batch['messages'])} chat messages for session {session_id} "
+                    f"after {attempts} attempts: {result}"
+                )
+                await asyncio.to_thread(self._dead_letter, batch["seqs"], attempts, str(result))
+                self.dead_lettered += len(batch["seqs"])
+                self._untrack(session_id, batch["messages"])
+            else:
+                logger.warning(f"Failed to flush {len(batch['messages'])} chat messages for session {session_id}: {result}")
+                await asyncio.to_thread(self._defer, batch["seqs"], attempts)
+        if done:
+            await asyncio.to_thread(self._delete, done)
+        return len(rows)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                # Keep going while full batches are waiting
+                while await self.flush() >= self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Chat journal flush failed: {e}")
+                await asyncio.sleep(self.retry_seconds)
+
+    async def start(self):
+        """Claim a journal, adopt orphaned ones, load unflushed turns and start the background flusher"""
+        adopted = await asyncio.to_thread(self._adopt_orphans)
+        if adopted:
+            logger.info(f"Adopted {adopted} chat turns from journals of stopped processes")
+        rows = await asyncio.to_thread(self._read_all)
+        self._pending = {}
+        for _, session_id, messages, _ in rows:
+            self._track(session_id, json.loads(messages))
+        if rows:
+            logger.info(f"Replaying {len(rows)} journaled chat turns from {self.slot_path}")
+        self._wakeup = asyncio.Event()
+        if rows:
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher after a last flush; anything left is replayed on the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final chat journal flush failed: {e}")
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            if self._slot_lock is not None:
+                self._slot_lock.close()
+                self._slot_lock = None
+                self.slot_path = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "journal": self.slot_path,
+            "pending_sessions": len(self._pending),
+            "pending_messages": sum(len(messages) for messages in self._pending.values()),
+            "flushed_messages": self.flushed,
+            "flush_failures": self.failures,
+            "dead_lettered_turns": self.dead_lettered
+        }
+
+# Global instance
+chat_journal = ChatJournal(
+    path=settings.CHAT_JOURNAL_PATH,
+    batch_size=settings.CHAT_JOURNAL_BATCH_SIZE,
+    flush_interval=settings.CHAT_JOURNAL_FLUSH_INTERVAL,
+    retry_seconds=settings.CHAT_JOURNAL_RETRY_SECONDS,
+    max_attempts=settings.CHAT_JOURNAL_MAX_ATTEMPTS
+)
@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import settings
+from utils.medical_extractor import MedicalExtractor
+
+logger = logging.getLogger(__name__)
+
+class DocumentCache:
+    """Content-addressed store of OCR text and extracted medical data.
+
+    Entries are keyed by the SHA-256 of the uploaded bytes and persisted in a
+    local SQLite file so they survive restarts. Once the stored text exceeds
+    max_bytes, the least recently used entries are evicted. Entries produced
+    by an older MedicalExtractor version are treated as misses.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS document_cache (
+                    content_hash TEXT PRIMARY KEY,
+                    extractor_version INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    medical_data TEXT NOT NULL,
+                    processing_stats TEXT,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_document_cache_last_used ON document_cache(last_used)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Return cached extraction results for a content hash, refreshing its recency"""
+        try:
+            with self._lock:
+                conn = self._get_conn()
+                row = conn.execute(
+                    "SELECT text, medical_data, processing_stats FROM document_cache "
+                    "WHERE content_hash = ? AND extractor_version = ?",
+                    (content_hash, MedicalExtractor.VERSION)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute(
+                    "UPDATE document_cache SET last_used = ? WHERE content_hash = ?",
+                    (time.time(), content_hash)
+                )
+                conn.commit()
+                self.hits += 1
+        except sqlite3.Error as e:
+            logger.error(f"Document cache lookup failed: {e}")
+            return None
+
+        return {
+            "text": row[0],
+            "medical_data": json.loads(row[1]),
+            "processing_stats": json.loads(row[2]) if row[2] else None
+        }
+
+    def put(self, content_hash: str, text: str, medical_data: Dict[str, Any], processing_stats: Optional[Dict[str, Any]] = None):
+        """Store extraction results, evicting least recently used entries past the size budget"""
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        try:
+            with self._lock:
+                conn = self._get_conn()
+                conn.execute(
+                    "INSERT OR REPLACE INTO document_cache "
+                    "(content_hash, extractor_version, text, medical_data, processing_stats, size, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        content_hash,
+                        MedicalExtractor.VERSION,
+                        text,
+                        json.dumps(medical_data),
+                        json.dumps(processing_stats) if processing_stats is not None else None,
+                        size,
+                        time.time()
+                    )
+                )
+                self._evict(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Document cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM document_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT content_hash, size FROM document_cache ORDER BY last_used ASC").fetchall()
+        evicted = []
+        for content_hash, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((content_hash,))
+            total -= size
+        conn.executemany("DELETE FROM document_cache WHERE content_hash = ?", evicted)
+        logger.info(f"Evicted {len(evicted)} entries from document cache")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Global instance
+document_cache = DocumentCache(
+    path=settings.DOCUMENT_CACHE_PATH,
+    max_bytes=settings.DOCUMENT_CACHE_MAX_BYTES
+)
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Set
+
+from config import settings
+from repositories import documents as documents_repo
+from utils.retrieval import document_retriever
+from utils.search_index import search_index
+from utils.document_cache import document_cache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = {"png", "jpg", "jpeg"}
+PDF_TYPES = {"pdf"}
+
+class DocumentStatus:
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+
+def _init_worker(tesseract_cmd: Optional[str]):
+    """Configure Tesseract inside each worker process"""
+    if os.name == 'nt' and tesseract_cmd:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+def ocr_image(data: bytes) -> str:
+    """OCR an image upload held in memory (runs in a worker process)"""
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as img:
+        return pytesseract.image_to_string(img)
+
+def read_pdf_text_layer(data: bytes) -> List[Dict[str, Any]]:
+    """Extract the embedded text layer of every PDF page (runs in a worker process).
+
+    Pages without a text layer are also split out as standalone single-page
+    PDFs so OCR workers only receive the page they rasterize.
+    """
+    import PyPDF2
+
+    pages = []
+    pdf_reader = PyPDF2.PdfReader(BytesIO(data))
+    for page in pdf_reader.pages:
+        started = time.perf_counter()
+        text = page.extract_text() or ""
+        entry = {"text": text, "seconds": time.perf_counter() - started}
+        if not text.strip():
+            writer = PyPDF2.PdfWriter()
+            writer.add_page(page)
+            page_pdf = BytesIO()
+            writer.write(page_pdf)
+            entry["pdf"] = page_pdf.getvalue()
+        pages.append(entry)
+    return pages
+
+def ocr_pdf_page(page_pdf: bytes, dpi: int) -> Dict[str, Any]:
+    """Rasterize a single-page PDF and OCR it (runs in a worker process)"""
+    import pytesseract
+    from pdf2image import convert_from_bytes
+
+    started = time.perf_counter()
+    images = convert_from_bytes(page_pdf, dpi=dpi)
+    text = "\n".join(pytesseract.image_to_string(img) for img in images)
+    return {"text": text, "seconds": time.perf_counter() - started}
+
+def extract_medical_info(text: str) -> Dict[str, Any]:
+    """Run the medical extractor (runs in a worker process)"""
+    from utils.medical_extractor import MedicalExtractor
+
+    return MedicalExtractor.extract_all_medical_info(text)
+
+class DocumentProcessor:
+    """Runs document OCR/parsing jobs on a bounded process pool"""
+
+    def __init__(self, max_workers: int, max_queued_jobs: int):
+        self.max_workers = max_workers
+        self.max_queued_jobs = max_queued_jobs
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        # Documents this process is working on, never swept as stale
+        self._active: Set[str] = set()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(settings.TESSERACT_PATH,)
+            )
+            logger.info(f"Started document processing pool with {self.max_workers} workers")
+        return self._executor
+
+    def has_capacity(self) -> bool:
+        """Whether another job can be queued without exceeding the backlog limit"""
+        return self._pending < self.max_queued_jobs
+
+    def reserve(self):
+        """Reserve a queue slot for a job that will be passed to process() later"""
+        self._pending += 1
+
+    def release(self):
+        """Give back a reserved slot (process() releases its own when it finishes)"""
+        self._pending -= 1
+
+    async def fail_stale_jobs(self):
+        """Mark jobs stuck in queued/processing as failed.
+
+        Uploads are only held in memory, so a job whose process crashed or
+        restarted can never finish. Only rows older than OCR_STALE_JOB_SECONDS
+        that this process is not working on are touched, so jobs that other
+        workers are still running are left alone.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.OCR_STALE_JOB_SECONDS)
+        try:
+            failed = await documents_repo.fail_documents(
+                [DocumentStatus.QUEUED, DocumentStatus.PROCESSING],
+                cutoff.isoformat(),
+                "Processing was interrupted. Please upload the document again.",
+                exclude_ids=list(self._active)
+            )
+        except Exception as e:
+            logger.error(f"Failed to clean up interrupted document jobs: {e}")
+            return
+        if failed:
+            logger.warning(f"Marked {len(failed)} interrupted document jobs as failed")
+
+    async def _sweep(self):
+        while True:
+            await self.fail_stale_jobs()
+            await asyncio.sleep(settings.OCR_STALE_SWEEP_SECONDS)
+
+    async def start(self):
+        """Start sweeping stale jobs, including those left by the previous run"""
+        self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); the pool is unusable, so the next job gets a fresh one
+            if self._executor is executor:
+                logger.error("Document processing pool is broken, restarting it")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            raise
+
+    async def _extract_pdf(self, data: bytes) -> Dict[str, Any]:
+        """Extract PDF text page by page, OCRing pages without a text layer in parallel"""
+        pages = await self._run(read_pdf_text_layer, data)
+        page_stats = [
+            {"page": number, "method": "text", "seconds": round(page["seconds"], 4)}
+            for number, page in enumerate(pages, start=1)
+        ]
+
+        # Scanned pages have no text layer; rasterize and OCR only those
+        scanned = [number for number, page in enumerate(pages, start=1) if "pdf" in page]
+        if scanned:
+            ocr_results = await asyncio.gather(*[
+                self._run(ocr_pdf_page, pages[number - 1].pop("pdf"), settings.OCR_DPI)
+                for number in scanned
+            ], return_exceptions=True)
+            for number, ocr in zip(scanned, ocr_results):
+                # A page that fails to rasterize stays empty rather than failing the document
+                if isinstance(ocr, Exception):
+                    logger.warning(f"OCR failed for PDF page {number}: {ocr}")
+                    page_stats[number - 1].update({"method": "ocr", "error": str(ocr)[:200]})
+                    continue
+                pages[number - 1]["text"] = ocr["text"]
+                page_stats[number - 1].update({"method": "ocr", "seconds": round(ocr["seconds"], 4)})
+
+        return {
+            "text": "\n".join(page["text"] for page in pages),
+            "pages": page_stats
+        }
+
+    async def _extract(self, data: bytes, file_type: str) -> Dict[str, Any]:
+        """OCR/parse an upload and extract medical info"""
+        if file_type in IMAGE_TYPES:
+            started = time.perf_counter()
+            text = await self._run(ocr_image, data)
+            extraction = {
+                "text": text,
+                "pages": [{"page": 1, "method": "ocr", "seconds": round(time.perf_counter() - started, 4)}]
+            }
+        elif file_type in PDF_TYPES:
+            extraction = await self._extract_pdf(data)
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
+
+        extraction["medical_data"] = await self._run(extract_medical_info, extraction["text"])
+        return extraction
+
+    async def process(self, document_id: str, data: bytes, file_type: str, content_hash: str, username: str, filename: str):
+        """Process an in-memory upload and record the outcome on its documents row"""
+        self._active.add(document_id)
+        try:
+            await documents_repo.update_document(document_id, {"status": DocumentStatus.PROCESSING})
+
+            started = time.perf_counter()
+            result = await self._extract(data, file_type)
+            processing_stats = {
+                "total_seconds": round(time.perf_counter() - started, 4),
+                "pages": result["pages"]
+            }
+
+            await documents_repo.update_document(document_id, {
+                "text": result["text"],
+                "medical_data": result["medical_data"],
+                "processing_stats": processing_stats,
+                "status": DocumentStatus.DONE,
+                "processed_at": "now()"
+            })
+        except Exception as e:
+            logger.error(f"Failed to process document {document_id}: {e}")
+            try:
+                await documents_repo.update_document(document_id, {
+                    "status": DocumentStatus.FAILED,
+                    "error": str(e)[:500]
+                })
+            except Exception as update_error:
+                logger.error(f"Failed to mark document {document_id} as failed: {update_error}")
+        else:
+            await self._index(document_id, result, processing_stats, content_hash, username, filename)
+        finally:
+            self._active.discard(document_id)
+            self.release()
+
+    async def _index(
+        self,
+        document_id: str,
+        result: Dict[str, Any],
+        processing_stats: Dict[str, Any],
+        content_hash: str,
+        username: str,
+        filename: str
+    ):
+        """Cache and index a processed document; the row is already done, so failures are only logged"""
+        try:
+            document_cache.put(content_hash, result["text"], result["medical_data"], processing_stats)
+            search_index.add_document(username, {
+                "id": document_id,
+                "filename": filename,
+                "text": result["text"],
+                "medical_data": result["medical_data"]
+            })
+            # Chunk and index now so the first chat about this document is fast
+            await document_retriever.index(document_id, result["text"])
+        except Exception as e:
+            logger.error(f"Failed to index document {document_id}: {e}")
+
+    def shutdown(self):
+        """Stop worker processes (called on application shutdown)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Global instance
+document_processor = DocumentProcessor(
+    max_workers=settings.OCR_WORKERS,
+    max_queued_jobs=settings.OCR_MAX_QUEUED_JOBS
+)
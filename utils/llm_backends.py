@@ -0,0 +1,289 @@
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from config import settings
+from utils.llm_client import OpenRouterClient, llm_client
+
+logger = logging.getLogger(__name__)
+
+class LLMBackend(ABC):
+    """A chat completion provider.
+
+    Payloads are OpenAI-style chat completion bodies without a model
+    ("messages", "temperature", "max_tokens"); the backend picks the model.
+    """
+
+    name: str
+
+    @abstractmethod
+    async def complete(self, payload: Dict[str, Any]) -> str:
+        """Return the reply text"""
+
+    @abstractmethod
+    def stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Yield the reply text in deltas"""
+
+    async def aclose(self):
+        pass
+
+class OpenRouterBackend(LLMBackend):
+    """A model served through OpenRouter (or any OpenAI-compatible endpoint)"""
+
+    def __init__(self, client: OpenRouterClient, model: str):
+        self.client = client
+        self.model = model
+        self.name = model if client.api_url == settings.OPENROUTER_API_URL else f"{model}@{client.api_url}"
+
+    async def complete(self, payload: Dict[str, Any]) -> str:
+        response = await self.client.post_chat_completion({**payload, "model": self.model})
+
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail=f"Error from OpenRouter API: {response.text}")
+
+        try:
+            result = response.json()
+            return result["choices"][0]["message"]["content"]
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to parse OpenRouter response: {e}")
+
+    def stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        return self.client.stream_chat_completion({**payload, "model": self.model})
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class LocalStubBackend(LLMBackend):
+    """Deterministic stand-in for tests and load tests; never leaves the process.
+
+    The reply depends only on the payload, so identical prompts get identical
+    answers. An optional delay simulates model latency.
+    """
+
+    def __init__(self, name: str = "local", delay: float = 0.0):
+        self.name = name
+        self.delay = delay
+
+    def _reply(self, payload: Dict[str, Any]) -> str:
+        messages = payload.get("messages") or []
+        user_message = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        digest = hashlib.sha256(repr(messages).encode("utf-8")).hexdigest()[:8]
+        excerpt = " ".join(user_message.split())[:200]
+        return (
+            f"[{self.name} {digest}] This is a locally generated placeholder response to: {excerpt}\n\n"
+            "Please consult a healthcare professional for medical advice."
+        )
+
+    async def complete(self, payload: Dict[str, Any]) -> str:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self._reply(payload)
+
+    async def stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        words = self._reply(payload).split(" ")
+        for index, word in enumerate(words):
+            if self.delay:
+                await asyncio.sleep(self.delay / len(words))
+            yield word if index == 0 else " " + word
+
+class BackendHealth:
+    """Latency and outcome of a backend's most recent calls"""
+
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.last_probe = -math.inf
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        self.requests += 1
+        self.outcomes.append(ok)
+        if not ok:
+            self.failures += 1
+        elif latency is not None:
+            self.latencies.append(latency)
+
+    def reset(self):
+        """Forget the window, e.g. once a backend that was failing answers again"""
+        self.latencies.clear()
+        self.outcomes.clear()
+
+    def p95(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+class LLMRouter:
+    """Routes completions across the configured backends.
+
+    Backends with enough recent samples are ranked by p95 latency, and
+    those whose error rate exceeds max_error_rate go last; until then the
+    configured order is kept. A call that fails moves on to the next
+    backend (streams only until the first delta has been sent). A small
+    share of calls is sent to another healthy backend so that its
+    measurements stay current.
+
+    An unhealthy backend gets no new samples from normal routing, so once
+    every probe_seconds one call tries it first (half-open). If it
+    succeeds, its window is cleared and it competes normally again; if
+    not, the call fails over as usual.
+    """
+
+    def __init__(
+        self,
+        backends: List[LLMBackend],
+        window: int,
+        min_samples: int,
+        max_error_rate: float,
+        explore_rate: float,
+        probe_seconds: float
+    ):
+        if not backends:
+            raise ValueError("At least one LLM backend must be configured")
+        self.backends = backends
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.explore_rate = explore_rate
+        self.probe_seconds = probe_seconds
+        self.health: Dict[str, BackendHealth] = {backend.name: BackendHealth(window) for backend in backends}
+
+    def _healthy(self, backend: LLMBackend) -> bool:
+        health = self.health[backend.name]
+        return len(health.outcomes) < self.min_samples or health.error_rate() <= self.max_error_rate
+
+    def ranked(self, probe: bool = True) -> List[LLMBackend]:
+        """Backends in the order they should be tried; probe=False leaves probe timing untouched"""
+        def key(item: Tuple[int, LLMBackend]):
+            position, backend = item
+            health = self.health[backend.name]
+            p95 = health.p95() if len(health.latencies) >= self.min_samples else None
+            return (not self._healthy(backend), p95 if p95 is not None else 0.0, position)
+
+        ordered = [backend for _, backend in sorted(enumerate(self.backends), key=key)]
+        if len(ordered) > 1 and random.random() < self.explore_rate:
+            candidates = [backend for backend in ordered[1:] if self._healthy(backend)]
+            if candidates:
+                choice = random.choice(candidates)
+                ordered.remove(choice)
+                ordered.insert(0, choice)
+
+        now = time.monotonic()
+        for backend in ordered[1:] if probe else []:
+            health = self.health[backend.name]
+            if not self._healthy(backend) and now - health.last_probe >= self.probe_seconds:
+                health.last_probe = now
+                ordered.remove(backend)
+                ordered.insert(0, backend)
+                break
+        return ordered
+
+    def _record_success(self, backend: LLMBackend, latency: Optional[float] = None):
+        if not self._healthy(backend):
+            logger.info(f"LLM backend {backend.name} recovered")
+            self.health[backend.name].reset()
+        self.health[backend.name].record(True, latency)
+
+    async def complete(self, payload: Dict[str, Any]) -> str:
+        error: Optional[Exception] = None
+        for backend in self.ranked():
+            started = time.perf_counter()
+            try:
+                reply = await backend.complete(payload)
+            except Exception as e:
+                self.health[backend.name].record(False)
+                logger.warning(f"LLM backend {backend.name} failed, trying the next one: {e}")
+                error = e
+                continue
+            self._record_success(backend, time.perf_counter() - started)
+            return reply
+        raise error
+
+    async def stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        error: Optional[Exception] = None
+        for backend in self.ranked():
+            started = False
+            try:
+                async for delta in backend.stream(payload):
+                    started = True
+                    yield delta
+            except Exception as e:
+                self.health[backend.name].record(False)
+                # Part of the reply has been sent; switching backends would garble it
+                if started:
+                    raise
+                logger.warning(f"LLM backend {backend.name} failed, trying the next one: {e}")
+                error = e
+                continue
+            # Streams vary in length, so only their outcome is recorded
+            self._record_success(backend)
+            return
+        raise error
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for backend in self.backends:
+            health = self.health[backend.name]
+            p95 = health.p95()
+            stats[backend.name] = {
+                "requests": health.requests,
+                "failures": health.failures,
+                "window_samples": len(health.outcomes),
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "error_rate": round(health.error_rate(), 3),
+                "healthy": self._healthy(backend)
+            }
+        return {"order": [backend.name for backend in self.ranked(probe=False)], "backends": stats}
+
+def build_backends(spec: str) -> List[LLMBackend]:
+    """Parse LLM_BACKENDS: comma-separated "local" or "openrouter:<model>[@<url>]" entries, in order of preference"""
+    clients: Dict[str, OpenRouterClient] = {settings.OPENROUTER_API_URL: llm_client}
+    backends: List[LLMBackend] = []
+    for entry in (part.strip() for part in spec.split(",")):
+        if not entry:
+            continue
+        if entry == "local":
+            backends.append(LocalStubBackend(delay=settings.LOCAL_LLM_DELAY))
+            continue
+        kind, _, target = entry.partition(":")
+        if kind != "openrouter" or not target:
+            raise ValueError(f"Invalid LLM backend: {entry!r}")
+        model, _, url = target.partition("@")
+        url = url or settings.OPENROUTER_API_URL
+        if url not in clients:
+            clients[url] = OpenRouterClient(
+                api_url=url,
+                api_key=settings.OPENROUTER_API_KEY,
+                connect_timeout=settings.LLM_CONNECT_TIMEOUT,
+                read_timeout=settings.LLM_READ_TIMEOUT,
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            )
+        backends.append(OpenRouterBackend(clients[url], model))
+    return backends
+
+# Global instance
+llm_router = LLMRouter(
+    build_backends(settings.LLM_BACKENDS),
+    window=settings.LLM_ROUTING_WINDOW,
+    min_samples=settings.LLM_ROUTING_MIN_SAMPLES,
+    max_error_rate=settings.LLM_ROUTING_MAX_ERROR_RATE,
+    explore_rate=settings.LLM_ROUTING_EXPLORE_RATE,
+    probe_seconds=settings.LLM_ROUTING_PROBE_SECONDS
+)
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class OpenRouterClient:
+    """Async OpenRouter client with a pooled connection and bounded concurrency"""
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: Optional[str],
+        connect_timeout: float,
+        read_timeout: float,
+        max_connections: int,
+        max_concurrency: int,
+    ):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Lazily create the shared HTTP client so it binds to the running loop"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._client
+
+    async def post_chat_completion(self, payload: Dict[str, Any]) -> httpx.Response:
+        """POST a chat completion payload, waiting for a free concurrency slot first"""
+        async with self._semaphore:
+            try:
+                return await self._get_client().post(self.api_url, json=payload)
+            except httpx.TimeoutException as e:
+                logger.error(f"OpenRouter request timed out: {e}")
+                raise HTTPException(status_code=504, detail="OpenRouter API timed out")
+            except httpx.HTTPError as e:
+                logger.error(f"OpenRouter request failed: {e}")
+                raise HTTPException(status_code=502, detail=f"Failed to reach OpenRouter API: {e}")
+
+    async def stream_chat_completion(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream a chat completion, yielding content deltas as they arrive.
+
+        Closing the generator (e.g. when the caller is cancelled) closes the
+        upstream response, which aborts generation on OpenRouter's side.
+        """
+        async with self._semaphore:
+            try:
+                async with self._get_client().stream(
+                    "POST", self.api_url, json={**payload, "stream": True}
+                ) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        raise HTTPException(
+                            status_code=500,
+                            detail=f"Error from OpenRouter API: {body.decode(errors='replace')}"
+                        )
+                    async for line in response.aiter_lines():
+                        # Skip blank keep-alives and SSE comments (": OPENROUTER PROCESSING")
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            logger.warning(f"Skipping malformed OpenRouter stream chunk: {data[:200]}")
+                            continue
+                        if "error" in chunk:
+                            raise HTTPException(status_code=500, detail=f"Error from OpenRouter API: {chunk['error']}")
+                        choices = chunk.get("choices") or [{}]
+                        delta = (choices[0].get("delta") or {}).get("content")
+                        if delta:
+                            yield delta
+            except httpx.TimeoutException as e:
+                logger.error(f"OpenRouter stream timed out: {e}")
+                raise HTTPException(status_code=504, detail="OpenRouter API timed out")
+            except httpx.HTTPError as e:
+                logger.error(f"OpenRouter stream failed: {e}")
+                raise HTTPException(status_code=502, detail=f"Failed to reach OpenRouter API: {e}")
+
+    async def aclose(self):
+        """Close pooled connections (called on application shutdown)"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+# Global instance
+llm_client = OpenRouterClient(
+    api_url=settings.OPENROUTER_API_URL,
+    api_key=settings.OPENROUTER_API_KEY,
+    connect_timeout=settings.LLM_CONNECT_TIMEOUT,
+    read_timeout=settings.LLM_READ_TIMEOUT,
+    max_connections=settings.LLM_MAX_CONNECTIONS,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+)
@@ -1,171 +1,210 @@
 import re
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Tuple
+
+# Extraction rules: (category, key, head alternatives, tail, first_only).
+# A rule's pattern is (?:alt1|alt2|...) followed by its tail. Every head
+# alternative starts with a literal character or a two-case class like [Bb],
+# which lets the scanner find candidate positions for all rules in one pass.
+# Rules with first_only=True keep the first match; the others collect every
+# non-overlapping match, exactly like re.findall.
+_RULES: List[Tuple[str, str, Tuple[str, ...], str, bool]] = [
+    # Vital measurements (e.g. BP: 120/80, Temp: 98.6F, HR: 72, SpO2: 98%)
+    ("measurements", "blood_pressure", ("BP", "[Bb]lood [Pp]ressure"), r'[\s:]*(\d{2,3})[\/](\d{2,3})(?:\s*mmHg)?', True),
+    ("measurements", "temperature_f", ("Temp", "[Tt]emperature"), r'[\s:]*(\d{2,3}(?:\.\d)?)[\s]*(?:F|°F|fahrenheit)', True),
+    ("measurements", "temperature_c", ("Temp", "[Tt]emperature"), r'[\s:]*(\d{2,3}(?:\.\d)?)[\s]*(?:C|°C|celsius)', True),
+    ("measurements", "heart_rate", ("HR", "[Hh]eart [Rr]ate", "[Pp]ulse"), r'[\s:]*(\d{2,3})(?:\s*bpm)?', True),
+    ("measurements", "respiratory_rate", ("RR", "[Rr]esp(?:iratory)? [Rr]ate"), r'[\s:]*(\d{1,2})', True),
+    ("measurements", "blood_glucose", ("BG", "[Bb]lood [Gg]lucose", "[Gg]lucose"), r'[\s:]*(\d{2,3})(?:\s*mg/dL)?', True),
+    ("measurements", "oxygen_saturation", ("SpO2", "[Oo]xygen [Ss]at(?:uration)?"), r'[\s:]*(\d{2,3})(?:\s*%)?', True),
+
+    # Medications (e.g. "Medication: Aspirin 81mg once daily")
+    ("medications", "medication", ("[Mm]edication", "[Mm]eds", "[Pp]rescribed", "[Tt]aking"),
+     r'[\s:]*([A-Za-z]+)[\s]+(\d+[\.]?\d*)\s?([a-zA-Z]+)(?:\s+(once|twice|three times|daily|every day|weekly|monthly|as needed|PRN|q\d+h))?', False),
+
+    # Diagnoses
+    ("diagnoses", "diagnosis", ("[Dd]iagnos(?:is|ed with)",), r'[\s:]*([^\.;,\n]+)', False),
+    ("diagnoses", "assessment", ("[Aa]ssessment",), r'[\s:]*([^\.;,\n]+)', False),
+    ("diagnoses", "impression", ("[Ii]mpression",), r'[\s:]*([^\.;,\n]+)', False),
+    ("diagnoses", "condition", ("[Cc]ondition",), r'[\s:]*([^\.;,\n]+)', False),
+
+    # Allergies
+    ("allergies", "allergy", ("[Aa]llerg(?:y|ies|ic to)",), r'[\s:]*([^\.;,\n]+)', False),
+    ("allergies", "adverse_reaction", ("[Aa]dverse [Rr]eaction[s]?",), r'[\s:]*([^\.;,\n]+)', False),
+
+    # Procedures
+    ("procedures", "procedure", ("[Pp]rocedure(?:s)?",), r'[\s:]*([^\.;,\n]+)', False),
+    ("procedures", "surgery", ("[Ss]urgery",), r'[\s:]*([^\.;,\n]+)', False),
+    ("procedures", "operation", ("[Oo]peration",), r'[\s:]*([^\.;,\n]+)', False),
+
+    # Laboratory results
+    ("lab_results", "hemoglobin", ("[Hh]emoglobin",), r'[\s:]*(\d+\.?\d*)', True),
+    ("lab_results", "wbc", ("WBC", "[Ww]hite [Bb]lood [Cc]ell"), r'[\s:]*(\d+\.?\d*)', True),
+    ("lab_results", "rbc", ("RBC", "[Rr]ed [Bb]lood [Cc]ell"), r'[\s:]*(\d+\.?\d*)', True),
+    ("lab_results", "platelets", ("[Pp]latelets?",), r'[\s:]*(\d+)', True),
+    ("lab_results", "cholesterol", ("Total [Cc]holesterol", "[Cc]holesterol"), r'[\s:]*(\d+)', True),
+    ("lab_results", "hdl", ("HDL",), r'[\s:]*(\d+)', True),
+    ("lab_results", "ldl", ("LDL",), r'[\s:]*(\d+)', True),
+    ("lab_results", "triglycerides", ("[Tt]riglycerides",), r'[\s:]*(\d+)', True),
+    ("lab_results", "a1c", ("A1C", "HbA1c"), r'[\s:]*(\d+\.?\d*)', True),
+    ("lab_results", "creatinine", ("[Cc]reatinine",), r'[\s:]*(\d+\.?\d*)', True),
+    ("lab_results", "bun", ("BUN", "[Bb]lood [Uu]rea [Nn]itrogen"), r'[\s:]*(\d+)', True),
+    ("lab_results", "alt", ("ALT",), r'[\s:]*(\d+)', True),
+    ("lab_results", "ast", ("AST",), r'[\s:]*(\d+)', True),
+]
+
+CATEGORIES = ("measurements", "medications", "diagnoses", "allergies", "procedures", "lab_results")
+
+_LEADING_CLASS = re.compile(r'\[([A-Za-z]{2})\]')
+
+def _split_leading_char(alternative: str) -> Tuple[str, str]:
+    """Split a head alternative into its possible first characters and the remainder"""
+    leading_class = _LEADING_CLASS.match(alternative)
+    if leading_class:
+        return leading_class.group(1), alternative[leading_class.end():]
+    return alternative[0], alternative[1:]
+
+class _ExtractionEngine:
+    """Precompiled single-pass scanner over a set of extraction rules.
+
+    All head alternatives are folded into one trigger regex grouped by first
+    character, so the regex engine skips non-candidate characters in C and
+    only stops where some keyword begins. At each hit, just the rules whose
+    heads can start with that character are matched, anchored at the hit.
+    """
+
+    def __init__(self, rules: List[Tuple[str, str, Tuple[str, ...], str, bool]]):
+        self.rules = rules
+        self.patterns = [re.compile("(?:" + "|".join(heads) + ")" + tail) for _, _, heads, tail, _ in rules]
+        self.first_only = [first_only for *_, first_only in rules]
+
+        branches: Dict[str, List[str]] = {}
+        self.rules_by_char: Dict[str, List[int]] = {}
+        for index, (_, _, heads, _, _) in enumerate(rules):
+            for alternative in heads:
+                first_chars, rest = _split_leading_char(alternative)
+                for char in first_chars:
+                    rests = branches.setdefault(char, [])
+                    if rest not in rests:
+                        rests.append(rest)
+                    rule_indexes = self.rules_by_char.setdefault(char, [])
+                    if index not in rule_indexes:
+                        rule_indexes.append(index)
+        self.trigger = re.compile("|".join(
+            re.escape(char) + "(?:" + "|".join(rests) + ")" for char, rests in branches.items()
+        ))
+
+    def scan(self, text: str) -> List[List[re.Match]]:
+        """Walk the text once and return the matches of every rule, in text order"""
+        matches: List[List[re.Match]] = [[] for _ in self.rules]
+        resume_at = [0] * len(self.rules)
+        done = [False] * len(self.rules)
+        search = self.trigger.search
+
+        pos = 0
+        while True:
+            hit = search(text, pos)
+            if hit is None:
+                break
+            start = hit.start()
+            for rule_index in self.rules_by_char[text[start]]:
+                # Honour re.findall's non-overlapping semantics per rule
+                if done[rule_index] or start < resume_at[rule_index]:
+                    continue
+                match = self.patterns[rule_index].match(text, start)
+                if match is None:
+                    continue
+                matches[rule_index].append(match)
+                resume_at[rule_index] = match.end()
+                if self.first_only[rule_index]:
+                    done[rule_index] = True
+            # Keywords can overlap (e.g. "HRR 70" holds both HR and RR), so advance one character
+            pos = start + 1
+        return matches
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        """Scan the text and build the structured result for every category covered"""
+        results: Dict[str, Any] = {}
+        for (category, key, *_), rule_matches in zip(self.rules, self.scan(text)):
+            if category == "measurements":
+                section = results.setdefault(category, {})
+                if rule_matches:
+                    section[key] = _convert_measurement(key, rule_matches[0])
+            elif category == "lab_results":
+                section = results.setdefault(category, {})
+                if rule_matches:
+                    try:
+                        section[key] = float(rule_matches[0].group(1))
+                    except ValueError:
+                        # Skip if value can't be converted to float
+                        pass
+            elif category == "medications":
+                section = results.setdefault(category, [])
+                for match in rule_matches:
+                    frequency = match.group(4)
+                    section.append({
+                        "name": match.group(1).strip(),
+                        "dosage": f"{match.group(2)} {match.group(3)}",
+                        "frequency": frequency.strip() if frequency and frequency.strip() else None
+                    })
+            else:
+                section = results.setdefault(category, [])
+                for match in rule_matches:
+                    value = match.group(1).strip()
+                    if value:
+                        section.append(value)
+        return results
+
+def _convert_measurement(key: str, match: re.Match) -> Any:
+    if key == "blood_pressure":
+        return f"{match.group(1)}/{match.group(2)}"
+    if key in ("temperature_f", "temperature_c"):
+        return float(match.group(1))
+    return int(match.group(1))
+
+_ENGINE = _ExtractionEngine(_RULES)
+_CATEGORY_ENGINES = {
+    category: _ExtractionEngine([rule for rule in _RULES if rule[0] == category])
+    for category in CATEGORIES
+}
 
 class MedicalExtractor:
     """Extracts structured medical information from text"""
-    
+
+    # Bump whenever extraction output changes so cached results are recomputed
+    VERSION = 1
+
     @staticmethod
     def extract_measurements(text: str) -> Dict[str, Any]:
         """Extract vital measurements like BP, temperature, etc."""
-        measurements = {}
-        
-        # Blood pressure pattern (e.g., BP: 120/80, blood pressure 120/80 mmHg)
-        bp_pattern = r'(?:BP|[Bb]lood [Pp]ressure)[\s:]*(\d{2,3})[\/](\d{2,3})(?:\s*mmHg)?'
-        bp_matches = re.findall(bp_pattern, text)
-        if bp_matches:
-            measurements['blood_pressure'] = f"{bp_matches[0][0]}/{bp_matches[0][1]}"
-        
-        # Temperature pattern (e.g., Temp: 98.6F, temperature 37.5°C)
-        temp_f_pattern = r'(?:Temp|[Tt]emperature)[\s:]*(\d{2,3}(?:\.\d)?)[\s]*(?:F|°F|fahrenheit)'
-        temp_c_pattern = r'(?:Temp|[Tt]emperature)[\s:]*(\d{2,3}(?:\.\d)?)[\s]*(?:C|°C|celsius)'
-        
-        temp_f_matches = re.findall(temp_f_pattern, text)
-        if temp_f_matches:
-            measurements['temperature_f'] = float(temp_f_matches[0])
-            
-        temp_c_matches = re.findall(temp_c_pattern, text)
-        if temp_c_matches:
-            measurements['temperature_c'] = float(temp_c_matches[0])
-        
-        # Heart rate pattern (e.g., HR: 72, pulse 72 bpm)
-        hr_pattern = r'(?:HR|[Hh]eart [Rr]ate|[Pp]ulse)[\s:]*(\d{2,3})(?:\s*bpm)?'
-        hr_matches = re.findall(hr_pattern, text)
-        if hr_matches:
-            measurements['heart_rate'] = int(hr_matches[0])
-        
-        # Respiratory rate pattern (e.g., RR: 16, resp rate 16)
-        rr_pattern = r'(?:RR|[Rr]esp(?:iratory)? [Rr]ate)[\s:]*(\d{1,2})'
-        rr_matches = re.findall(rr_pattern, text)
-        if rr_matches:
-            measurements['respiratory_rate'] = int(rr_matches[0])
-        
-        # Blood glucose pattern (e.g., glucose: 120 mg/dL, BG 120)
-        bg_pattern = r'(?:BG|[Bb]lood [Gg]lucose|[Gg]lucose)[\s:]*(\d{2,3})(?:\s*mg/dL)?'
-        bg_matches = re.findall(bg_pattern, text)
-        if bg_matches:
-            measurements['blood_glucose'] = int(bg_matches[0])
-        
-        # Oxygen saturation pattern (e.g., SpO2: 98%, O2 sat 98%)
-        o2_pattern = r'(?:SpO2|[Oo]xygen [Ss]at(?:uration)?)[\s:]*(\d{2,3})(?:\s*%)?'
-        o2_matches = re.findall(o2_pattern, text)
-        if o2_matches:
-            measurements['oxygen_saturation'] = int(o2_matches[0])
-        
-        return measurements
-    
+        return _CATEGORY_ENGINES["measurements"].extract(text)["measurements"]
+
     @staticmethod
     def extract_medications(text: str) -> List[Dict[str, Any]]:
         """Extract medication information"""
-        medications = []
-        
-        # Simple medication pattern (e.g., "Medication: Aspirin 81mg once daily")
-        med_pattern = r'(?:[Mm]edication|[Mm]eds|[Pp]rescribed|[Tt]aking)[\s:]*([A-Za-z]+)[\s]+(\d+[\.]?\d*)\s?([a-zA-Z]+)(?:\s+(once|twice|three times|daily|every day|weekly|monthly|as needed|PRN|q\d+h))?'
-        med_matches = re.findall(med_pattern, text)
-        
-        for match in med_matches:
-            medications.append({
-                "name": match[0].strip(),
-                "dosage": f"{match[1]} {match[2]}",
-                "frequency": match[3].strip() if len(match) > 3 and match[3].strip() else None
-            })
-        
-        return medications
-    
+        return _CATEGORY_ENGINES["medications"].extract(text)["medications"]
+
     @staticmethod
     def extract_diagnoses(text: str) -> List[str]:
         """Extract diagnostic information"""
-        diagnoses = []
-        
-        # Look for diagnosis patterns
-        diagnosis_patterns = [
-            r'[Dd]iagnos(?:is|ed with)[\s:]*([^\.;,\n]+)',
-            r'[Aa]ssessment[\s:]*([^\.;,\n]+)',
-            r'[Ii]mpression[\s:]*([^\.;,\n]+)',
-            r'[Cc]ondition[\s:]*([^\.;,\n]+)',
-        ]
-        
-        for pattern in diagnosis_patterns:
-            matches = re.findall(pattern, text)
-            diagnoses.extend([match.strip() for match in matches if match.strip()])
-        
-        return diagnoses
-    
+        return _CATEGORY_ENGINES["diagnoses"].extract(text)["diagnoses"]
+
     @staticmethod
     def extract_allergies(text: str) -> List[str]:
         """Extract allergy information"""
-        allergies = []
-        
-        # Look for allergy patterns
-        allergy_patterns = [
-            r'[Aa]llerg(?:y|ies|ic to)[\s:]*([^\.;,\n]+)',
-            r'[Aa]dverse [Rr]eaction[s]?[\s:]*([^\.;,\n]+)',
-        ]
-        
-        for pattern in allergy_patterns:
-            matches = re.findall(pattern, text)
-            allergies.extend([match.strip() for match in matches if match.strip()])
-        
-        return allergies
-    
+        return _CATEGORY_ENGINES["allergies"].extract(text)["allergies"]
+
     @staticmethod
     def extract_procedures(text: str) -> List[str]:
         """Extract medical procedures"""
-        procedures = []
-        
-        # Look for procedure patterns
-        procedure_patterns = [
-            r'[Pp]rocedure(?:s)?[\s:]*([^\.;,\n]+)',
-            r'[Ss]urgery[\s:]*([^\.;,\n]+)',
-            r'[Oo]peration[\s:]*([^\.;,\n]+)',
-        ]
-        
-        for pattern in procedure_patterns:
-            matches = re.findall(pattern, text)
-            procedures.extend([match.strip() for match in matches if match.strip()])
-        
-        return procedures
-    
+        return _CATEGORY_ENGINES["procedures"].extract(text)["procedures"]
+
     @staticmethod
     def extract_lab_results(text: str) -> Dict[str, Any]:
         """Extract laboratory results"""
-        lab_results = {}
-        
-        # Common lab result patterns
-        lab_patterns = {
-            "hemoglobin": r'[Hh]emoglobin[\s:]*(\d+\.?\d*)',
-            "wbc": r'(?:WBC|[Ww]hite [Bb]lood [Cc]ell)[\s:]*(\d+\.?\d*)',
-            "rbc": r'(?:RBC|[Rr]ed [Bb]lood [Cc]ell)[\s:]*(\d+\.?\d*)',
-            "platelets": r'[Pp]latelets?[\s:]*(\d+)',
-            "cholesterol": r'(?:Total )?[Cc]holesterol[\s:]*(\d+)',
-            "hdl": r'HDL[\s:]*(\d+)',
-            "ldl": r'LDL[\s:]*(\d+)',
-            "triglycerides": r'[Tt]riglycerides[\s:]*(\d+)',
-            "a1c": r'(?:A1C|HbA1c)[\s:]*(\d+\.?\d*)',
-            "creatinine": r'[Cc]reatinine[\s:]*(\d+\.?\d*)',
-            "bun": r'(?:BUN|[Bb]lood [Uu]rea [Nn]itrogen)[\s:]*(\d+)',
-            "alt": r'ALT[\s:]*(\d+)',
-            "ast": r'AST[\s:]*(\d+)',
-        }
-        
-        for key, pattern in lab_patterns.items():
-            matches = re.findall(pattern, text)
-            if matches:
-                try:
-                    lab_results[key] = float(matches[0])
-                except ValueError:
-                    # Skip if value can't be converted to float
-                    pass
-        
-        return lab_results
-    
+        return _CATEGORY_ENGINES["lab_results"].extract(text)["lab_results"]
+
     @staticmethod
     def extract_all_medical_info(text: str) -> Dict[str, Any]:
-        """Extract all medical information from text"""
-        return {
-            "measurements": MedicalExtractor.extract_measurements(text),
-            "medications": MedicalExtractor.extract_medications(text),
-            "diagnoses": MedicalExtractor.extract_diagnoses(text),
-            "allergies": MedicalExtractor.extract_allergies(text),
-            "procedures": MedicalExtractor.extract_procedures(text),
-            "lab_results": MedicalExtractor.extract_lab_results(text)
-        }
+        """Extract all medical information from text in a single pass"""
+        results = _ENGINE.extract(text)
+        return {category: results[category] for category in CATEGORIES}
@@ -0,0 +1,23 @@
+import base64
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+def encode_cursor(row: Dict[str, Any], fields: List[str]) -> str:
+    """Opaque keyset cursor pointing just past the given row"""
+    payload = json.dumps([row.get(field) for field in fields], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """Decode a cursor made by encode_cursor, rejecting tampered values with a 400"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        values = None
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(v, str) for v in values):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification on a dedicated, bounded thread pool.
+
+    bcrypt is CPU bound (~250ms at 12 rounds), so it is kept off the event loop
+    and off the shared request threadpool. At most max_pending operations may
+    be queued or running; beyond that callers get a 503 instead of piling up.
+    Hashes made with a different round count are flagged for rehash on login.
+    """
+
+    def __init__(self, rounds: int, workers: int, max_pending: int):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        # min/max pinned to the target so verify_and_update rehashes on any round change
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _timed(self, func: Callable, submitted_at: float, *args) -> Any:
+        started = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._wait_seconds += started - submitted_at
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+                self._run_seconds += time.perf_counter() - started
+
+    async def _submit(self, func: Callable, *args) -> Any:
+        with self._lock:
+            if self._queued + self._active >= self.max_pending:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many authentication requests in progress, please retry shortly"
+                )
+            self._queued += 1
+        future = self._get_executor().submit(self._timed, func, time.perf_counter(), *args)
+        future.add_done_callback(self._on_done)
+        # Cancelling the awaiting request cancels the job if it has not started yet
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future: Future):
+        # A cancelled job never reached _timed, so release its queue slot here
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with the configured round count"""
+        return await self._submit(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, stored_hash: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password; also returns a replacement hash when the stored one is outdated"""
+        verified, new_hash = await self._submit(self.context.verify_and_update, password, stored_hash)
+        if new_hash:
+            with self._lock:
+                self._rehashed += 1
+        return verified, new_hash
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self._completed
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queued": self._queued,
+                "active": self._active,
+                "completed": completed,
+                "rejected": self._rejected,
+                "rehashed": self._rehashed,
+                "avg_wait_ms": round(self._wait_seconds / completed * 1000, 2) if completed else 0.0,
+                "avg_run_ms": round(self._run_seconds / completed * 1000, 2) if completed else 0.0
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasher(
+    rounds=settings.BCRYPT_ROUNDS,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
@@ -0,0 +1,160 @@
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from utils.cache import TTLCache
+
+# Rough chat-format overhead per message (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Longest excerpt kept from a single turn in the rolling summary
+SUMMARY_LINE_CHARS = 200
+
+SUMMARY_HEADER = "Summary of earlier conversation:\n"
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return math.ceil(len(text) / 4) if text else 0
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, preferring a word boundary"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    if space > max_chars * 0.8:
+        cut = cut[:space]
+    return cut + "…"
+
+def summarize_turn(message: Dict[str, str]) -> str:
+    """Extractive one-line summary of a turn: its first sentence, capped in length"""
+    content = " ".join(message["content"].split())
+    first_sentence = _SENTENCE_END.split(content, 1)[0]
+    if len(first_sentence) > SUMMARY_LINE_CHARS:
+        first_sentence = first_sentence[:SUMMARY_LINE_CHARS].rstrip() + "…"
+    return f"{message['role']}: {first_sentence}"
+
+class PromptBuilder:
+    """Assembles chat messages within a token budget.
+
+    Parts are filled by priority: the system prompt and user message first,
+    then the document, then conversation history. Each part takes at most
+    its own budget and whatever the earlier parts left of the total. History
+    keeps the newest turns verbatim; turns that no longer fit are folded
+    into a rolling extractive summary, cached per session so each turn is
+    only summarized once.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        user_tokens: int,
+        document_tokens: int,
+        history_tokens: int,
+        summary_tokens: int,
+        summary_cache: TTLCache
+    ):
+        self.max_tokens = max_tokens
+        self.user_tokens = user_tokens
+        self.document_tokens = document_tokens
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.summary_cache = summary_cache
+
+    def _rolling_summary(self, session_id: Optional[str], older: List[Dict[str, Any]], budget: int) -> str:
+        """Summary lines for turns dropped from the verbatim history, oldest lines trimmed first"""
+        cached: Optional[Tuple[Any, List[str]]] = self.summary_cache.get(session_id) if session_id else None
+        lines: List[str] = []
+        start = 0
+        if cached is not None:
+            last_id, cached_lines = cached
+            ids = [message.get("id") for message in older]
+            # Reuse the cached lines when the summarized turns are still the oldest ones
+            if last_id in ids:
+                lines = list(cached_lines)
+                start = ids.index(last_id) + 1
+        lines.extend(summarize_turn(message) for message in older[start:])
+
+        while lines and estimate_tokens("\n".join(lines)) > budget:
+            lines.pop(0)
+        if session_id and older:
+            self.summary_cache.set(session_id, (older[-1].get("id"), lines))
+        return "\n".join(lines)
+
+    def _fit_history(
+        self,
+        history: List[Dict[str, Any]],
+        budget: int,
+        session_id: Optional[str]
+    ) -> List[Dict[str, str]]:
+        kept: List[Dict[str, str]] = []
+        used = 0
+        split = len(history)
+        summary_overhead = estimate_tokens(SUMMARY_HEADER) + MESSAGE_OVERHEAD_TOKENS
+        summary_reserve = min(self.summary_tokens + summary_overhead, budget // 2)
+        # Walk back from the newest turn until the budget is spent, leaving room
+        # for a summary while there are older turns left
+        for index in range(len(history) - 1, -1, -1):
+            message = {"role": history[index]["role"], "content": history[index]["content"]}
+            cost = message_tokens(message)
+            if used + cost > budget - (summary_reserve if index > 0 else 0):
+                break
+            kept.insert(0, message)
+            used += cost
+            split = index
+
+        older = history[:split]
+        summary_budget = min(self.summary_tokens, budget - used - summary_overhead)
+        if not older or summary_budget <= 0:
+            return kept
+        summary = self._rolling_summary(session_id, older, summary_budget)
+        if not summary:
+            return kept
+        return [{"role": "system", "content": SUMMARY_HEADER + summary}] + kept
+
+    def build(
+        self,
+        system_prompt: str,
+        user_message: str,
+        document: str = "",
+        history: Optional[List[Dict[str, Any]]] = None,
+        session_id: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """Return the messages for a chat completion, oldest first"""
+        remaining = self.max_tokens - estimate_tokens(system_prompt) - MESSAGE_OVERHEAD_TOKENS
+
+        user_content = truncate_to_tokens(user_message, max(min(self.user_tokens, remaining), 1))
+        remaining -= estimate_tokens(user_content) + MESSAGE_OVERHEAD_TOKENS
+
+        document_message = None
+        if document and document.strip() and remaining > MESSAGE_OVERHEAD_TOKENS:
+            document_budget = min(self.document_tokens, remaining) - MESSAGE_OVERHEAD_TOKENS
+            document_message = {"role": "system", "content": f"Document: {truncate_to_tokens(document, document_budget)}"}
+            remaining -= message_tokens(document_message)
+
+        history_messages: List[Dict[str, str]] = []
+        if history and remaining > 0:
+            history_messages = self._fit_history(history, min(self.history_tokens, remaining), session_id)
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if document_message:
+            messages.append(document_message)
+        messages.extend(history_messages)
+        messages.append({"role": "user", "content": user_content})
+        return messages
+
+prompt_builder = PromptBuilder(
+    max_tokens=settings.PROMPT_MAX_TOKENS,
+    user_tokens=settings.PROMPT_USER_TOKENS,
+    document_tokens=settings.PROMPT_DOCUMENT_TOKENS,
+    history_tokens=settings.PROMPT_HISTORY_TOKENS,
+    summary_tokens=settings.PROMPT_SUMMARY_TOKENS,
+    summary_cache=TTLCache(maxsize=10000, ttl=6 * 60 * 60)
+)
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Upper bound (inclusive, in days) and label of each duration bucket
+DURATION_BUCKETS = ((1, "0-1"), (3, "2-3"), (7, "4-7"), (14, "8-14"), (30, "15-30"), (90, "31-90"))
+
+def normalize_symptoms(symptoms: List[str]) -> List[str]:
+    """Lower-case, collapse whitespace, drop duplicates and sort"""
+    normalized = {" ".join(symptom.lower().split()) for symptom in symptoms}
+    return sorted(symptom for symptom in normalized if symptom)
+
+def duration_bucket(days: Optional[int]) -> Optional[str]:
+    """Map a duration in days to a coarse range such as "4-7" """
+    if days is None:
+        return None
+    for upper, label in DURATION_BUCKETS:
+        if days <= upper:
+            return label
+    return f"over {DURATION_BUCKETS[-1][0]}"
+
+def text_hash(text: Optional[str]) -> Optional[str]:
+    """SHA-256 of a prompt component, so large texts never become part of a key"""
+    if not text:
+        return None
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Caches LLM responses by a canonical fingerprint of their prompt inputs.
+
+    Any store with get(key) and set(key, value) can be plugged in; the
+    default is an in-process TTL/LRU cache. Callers must put everything the
+    prompt depends on into the fingerprint (hashing user-specific parts such
+    as profile and document text), so one user's answer is only ever reused
+    for an identical prompt.
+    """
+
+    def __init__(self, store: Any):
+        self.store = store
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def fingerprint(kind: str, parts: Dict[str, Any]) -> str:
+        canonical = json.dumps({"kind": kind, **parts}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _count(self, kind: str, outcome: str):
+        with self._lock:
+            counters = self._counters.setdefault(kind, {"hits": 0, "misses": 0})
+            counters[outcome] += 1
+
+    async def get_or_generate(
+        self,
+        kind: str,
+        parts: Dict[str, Any],
+        generate: Callable[[], Awaitable[str]]
+    ) -> Tuple[str, bool]:
+        """Return (response, cache_hit), calling generate() and storing its result on a miss"""
+        key = self.fingerprint(kind, parts)
+        try:
+            cached = self.store.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            self._count(kind, "hits")
+            return cached, True
+
+        self._count(kind, "misses")
+        response = await generate()
+        try:
+            self.store.set(key, response)
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {e}")
+        return response, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_kind = {kind: dict(counters) for kind, counters in self._counters.items()}
+        stats = {"by_kind": by_kind}
+        if hasattr(self.store, "stats"):
+            stats["store"] = self.store.stats()
+        return stats
+
+response_cache = ResponseCache(
+    TTLCache(maxsize=settings.RESPONSE_CACHE_MAX_SIZE, ttl=settings.RESPONSE_CACHE_TTL_SECONDS)
+)
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from config import settings
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'(?<=[.!?;])\s+|\n')
+
+def split_into_chunks(text: str, chunk_chars: int) -> List[str]:
+    """Pack paragraphs/sentences into chunks of about chunk_chars, in reading order.
+
+    Sentences are split with a regex rather than nltk's punkt model, which
+    would need a separate data download at runtime.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        for sentence in _SENTENCE_END.split(paragraph):
+            sentence = " ".join(sentence.split())
+            if not sentence:
+                continue
+            # Hard-wrap sentences longer than a chunk (OCR output often lacks punctuation)
+            pieces = [sentence[i:i + chunk_chars] for i in range(0, len(sentence), chunk_chars)]
+            for piece in pieces:
+                if current and size + len(piece) + 1 > chunk_chars:
+                    chunks.append(" ".join(current))
+                    current, size = [], 0
+                current.append(piece)
+                size += len(piece) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+class ChunkIndex:
+    """TF-IDF index over the chunks of one document"""
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = chunks
+        self.vectorizer = TfidfVectorizer(sublinear_tf=True, stop_words="english", ngram_range=(1, 2))
+        try:
+            self.matrix = self.vectorizer.fit_transform(chunks)
+        except ValueError:
+            # Nothing indexable (e.g. only stop words or symbols)
+            self.matrix = None
+
+    def top_chunks(self, query: str, k: int) -> List[int]:
+        """Indexes of the k chunks most similar to the query, best first"""
+        if self.matrix is None or not query.strip():
+            return []
+        query_vector = self.vectorizer.transform([query])
+        # Rows are L2-normalized, so the dot product is the cosine similarity
+        scores = (self.matrix @ query_vector.T).toarray().ravel()
+        ranked = scores.argsort()[::-1][:k]
+        return [int(index) for index in ranked if scores[index] > 0]
+
+class DocumentRetriever:
+    """Selects the parts of a document relevant to a query.
+
+    Documents are split into chunks and indexed with TF-IDF once (at upload
+    time or on first use), and the indexes are kept in an LRU cache. Short
+    documents are returned whole; when nothing matches the query, the
+    opening chunks are used, as before.
+    """
+
+    def __init__(self, chunk_chars: int, top_k: int, cache: TTLCache):
+        self.chunk_chars = chunk_chars
+        self.top_k = top_k
+        self.cache = cache
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        """Cache key for text that is not a stored document (e.g. pasted into a chat)"""
+        return "text:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _get_index(self, key: str, text: str) -> ChunkIndex:
+        index = self.cache.get(key)
+        if index is None:
+            index = ChunkIndex(split_into_chunks(text, self.chunk_chars))
+            self.cache.set(key, index)
+        return index
+
+    async def index(self, key: str, text: str):
+        """Chunk and index a document ahead of its first query"""
+        if text and len(text) > self.chunk_chars:
+            await asyncio.to_thread(self._get_index, key, text)
+
+    def _select(self, key: str, text: str, query: str, max_chars: int, k: int) -> str:
+        index = self._get_index(key, text)
+        selected = index.top_chunks(query, k) or list(range(min(k, len(index.chunks))))
+        parts: List[Tuple[int, str]] = []
+        size = 0
+        for position in selected:
+            chunk = index.chunks[position]
+            if parts and size + len(chunk) > max_chars:
+                continue
+            parts.append((position, chunk[:max_chars - size]))
+            size += len(chunk)
+        # Present the excerpts in reading order
+        return "\n...\n".join(chunk for _, chunk in sorted(parts))
+
+    async def retrieve(self, key: str, text: str, query: str, max_chars: int, k: Optional[int] = None) -> str:
+        """Return up to max_chars of the document's chunks most relevant to the query"""
+        if not text or len(text) <= max_chars:
+            return text or ""
+        try:
+            return await asyncio.to_thread(self._select, key, text, query, max_chars, k or self.top_k)
+        except Exception as e:
+            logger.warning(f"Retrieval failed for {key}, falling back to the document start: {e}")
+            return text[:max_chars]
+
+document_retriever = DocumentRetriever(
+    chunk_chars=settings.RETRIEVAL_CHUNK_CHARS,
+    top_k=settings.RETRIEVAL_TOP_K,
+    cache=TTLCache(maxsize=settings.RETRIEVAL_INDEX_CACHE_SIZE)
+)
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config import settings
+from repositories import chat as chat_repo, documents as documents_repo
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'\w+')
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+SNIPPET_CHARS = 160
+# Only the start of each entry's text is kept for snippets; the rest lives only in the postings
+SNIPPET_SOURCE_CHARS = 4096
+# Rough per-entry and per-posting overhead, for sizing the index cache in bytes
+ENTRY_OVERHEAD_BYTES = 400
+POSTING_OVERHEAD_BYTES = 100
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if len(token) > 1]
+
+def flatten_medical_data(medical_data: Optional[Dict[str, Any]]) -> str:
+    """Searchable text from extracted medical data (medication names, diagnoses, lab names...)"""
+    if not medical_data:
+        return ""
+    parts: List[str] = []
+
+    def walk(value: Any, key: Optional[str] = None):
+        if isinstance(value, dict):
+            for child_key, child in value.items():
+                walk(child, child_key)
+        elif isinstance(value, list):
+            for child in value:
+                walk(child, key)
+        elif value is not None:
+            parts.append(f"{key.replace('_', ' ')} {value}" if key else str(value))
+
+    walk(medical_data)
+    return "; ".join(parts)
+
+def make_snippet(text: str, terms: Set[str]) -> str:
+    """A window of text around the first query term it contains"""
+    pattern = re.compile(r'\b(?:' + "|".join(re.escape(term) for term in terms) + r')\b', re.IGNORECASE)
+    match = pattern.search(text)
+    first = match.start() if match else 0
+    start = max(0, first - SNIPPET_CHARS // 3)
+    snippet = " ".join(text[start:start + SNIPPET_CHARS].split())
+    return ("…" if start else "") + snippet + ("…" if start + SNIPPET_CHARS < len(text) else "")
+
+class UserIndex:
+    """BM25 inverted index over one user's documents and chat messages"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.total_length = 0
+        self.size = 0  # Approximate memory use in bytes
+
+    def add(self, key: str, text: str, meta: Dict[str, Any]):
+        """Index an entry, replacing any previous version with the same key"""
+        self.remove(key)
+        counts = Counter(tokenize(text))
+        if not counts:
+            return
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[key] = frequency
+        length = sum(counts.values())
+        self.lengths[key] = length
+        self.total_length += length
+        source = text[:SNIPPET_SOURCE_CHARS]
+        entry_size = ENTRY_OVERHEAD_BYTES + len(source) + POSTING_OVERHEAD_BYTES * len(counts)
+        self.entries[key] = {"text": source, "terms": set(counts), "size": entry_size, **meta}
+        self.size += entry_size
+
+    def remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for term in entry["terms"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(key)
+        self.size -= entry["size"]
+
+    def remove_where(self, predicate):
+        for key in [key for key, entry in self.entries.items() if predicate(entry)]:
+            self.remove(key)
+
+    def search(self, query: str, limit: int, types: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        terms = set(tokenize(query))
+        if not terms or not self.entries:
+            return []
+        total = len(self.entries)
+        average_length = self.total_length / total
+        scores: Dict[str, float] = {}
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, frequency in postings.items():
+                norm = frequency + K1 * (1 - B + B * self.lengths[key] / average_length)
+                scores[key] = scores.get(key, 0.0) + idf * frequency * (K1 + 1) / norm
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for key, score in ranked:
+            entry = self.entries[key]
+            if types and entry["type"] not in types:
+                continue
+            result = {k: v for k, v in entry.items() if k not in ("text", "terms", "size")}
+            result["score"] = round(score, 4)
+            result["snippet"] = make_snippet(entry["text"], terms)
+            results.append(result)
+            if len(results) >= limit:
+                break
+        return results
+
+class SearchIndex:
+    """Per-user search indexes, built from the database on first use and then
+    kept current incrementally as documents are processed and messages saved.
+
+    Indexes live in an LRU cache with a TTL, bounded by their approximate
+    size in bytes, so inactive users are dropped and any missed update is
+    corrected on the next rebuild. Builds read the database a page at a time.
+    """
+
+    def __init__(self, cache: TTLCache):
+        self.cache = cache
+        self._building: Dict[str, List[tuple]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def _document_entry(doc: Dict[str, Any]) -> tuple:
+        text = "\n".join(part for part in (
+            doc.get("filename"), doc.get("text"), flatten_medical_data(doc.get("medical_data"))
+        ) if part)
+        return f"document:{doc['id']}", text, {"type": "document", "id": doc["id"], "filename": doc.get("filename")}
+
+    @staticmethod
+    def _message_entry(message: Dict[str, Any], session_id: str) -> tuple:
+        return f"message:{message['id']}", message.get("content") or "", {
+            "type": "message",
+            "id": message["id"],
+            "session_id": session_id,
+            "role": message.get("role"),
+            "created_at": message.get("created_at")
+        }
+
+    def _apply(self, username: str, operation: tuple):
+        """Apply an add/remove to a loaded index, or queue it while the index is being built"""
+        if username in self._building:
+            self._building[username].append(operation)
+            return
+        index = self.cache.get(username)
+        if index is None:
+            return  # Picked up when the index is next built
+        if operation[0] == "add":
+            index.add(*operation[1:])
+        else:
+            index.remove_where(operation[1])
+
+    def add_document(self, username: str, doc: Dict[str, Any]):
+        self._apply(username, ("add", *self._document_entry(doc)))
+
+    def add_message(self, username: str, session_id: str, message: Dict[str, Any]):
+        self._apply(username, ("add", *self._message_entry(message, session_id)))
+
+    def remove_session(self, username: str, session_id: str):
+        self._apply(username, ("remove", lambda entry: entry.get("session_id") == session_id))
+
+    async def _build(self, username: str) -> UserIndex:
+        index = UserIndex()
+        page_size = settings.SEARCH_INDEX_BUILD_PAGE_SIZE
+
+        def index_page(entries: List[tuple]):
+            for entry in entries:
+                index.add(*entry)
+
+        position = None
+        while True:
+            documents = await documents_repo.list_documents_page(
+                username, "id, created_at, filename, text, medical_data", page_size, position
+            )
+            await asyncio.to_thread(index_page, [self._document_entry(doc) for doc in documents])
+            if len(documents) < page_size:
+                break
+            position = (documents[-1]["created_at"], documents[-1]["id"])
+
+        position = None
+        while True:
+            messages = await chat_repo.list_user_messages_page(username, page_size, position)
+            await asyncio.to_thread(index_page, [self._message_entry(message, message["session_id"]) for message in messages])
+            if len(messages) < page_size:
+                break
+            position = (messages[-1]["created_at"], messages[-1]["id"])
+        return index
+
+    async def get_index(self, username: str) -> UserIndex:
+        index = self.cache.get(username)
+        if index is not None:
+            return index
+        lock = self._locks.setdefault(username, asyncio.Lock())
+        async with lock:
+            index = self.cache.get(username)
+            if index is not None:
+                return index
+            started = time.perf_counter()
+            self._building[username] = []
+            try:
+                index = await self._build(username)
+                # Replay updates that arrived while the database was being read
+                for operation in self._building[username]:
+                    if operation[0] == "add":
+                        index.add(*operation[1:])
+                    else:
+                        index.remove_where(operation[1])
+            finally:
+                del self._building[username]
+                self._locks.pop(username, None)
+            self.cache.set(username, index)
+            logger.info(f"Built search index for {username}: {len(index.entries)} entries, ~{index.size // 1024}KB in {time.perf_counter() - started:.2f}s")
+            return index
+
+    async def search(self, username: str, query: str, limit: int, types: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        index = await self.get_index(username)
+        return index.search(query, limit, set(types) if types else None)
+
+search_index = SearchIndex(
+    TTLCache(
+        maxsize=settings.SEARCH_INDEX_MAX_BYTES,
+        ttl=settings.SEARCH_INDEX_TTL_SECONDS,
+        weigher=lambda index: index.size
+    )
+)
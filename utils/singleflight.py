@@ -0,0 +1,55 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    """Canonical fingerprint of a request payload (key order does not matter)"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class SingleFlight:
+    """Coalesces identical concurrent calls into one.
+
+    The first caller for a key starts the call; callers arriving with the
+    same key while it is in flight wait for that result (or exception)
+    instead of starting their own. The call runs as its own task, so one
+    waiter disconnecting does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            logger.debug(f"Joining in-flight call {key[:12]}")
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Mark the exception as retrieved even if every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "upstream_calls": self.executions,
+            "saved_calls": self.calls - self.executions,
+            "in_flight": len(self._inflight)
+        }
+
+# Shared by all non-streaming OpenRouter completions
+llm_singleflight = SingleFlight()
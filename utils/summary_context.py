@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from middleware.user_context import UserContext
+from models.users import UserRole
+from repositories import documents as documents_repo, medical as medical_repo
+
+# Total characters of document/analysis excerpts sent to the model
+MAX_CONTEXT_CHARS = 3000
+
+PROFILE_FIELDS = ("medical_history", "allergies", "current_medications")
+
+async def _no_profile() -> None:
+    return None
+
+def profile_fingerprint(profile: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Hash of the profile fields that feed the summary, to detect edits"""
+    if not profile:
+        return None
+    fields = {field: profile.get(field) for field in PROFILE_FIELDS}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+async def gather_summary_sources(context: UserContext, watermark: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fetch document and analysis previews and the patient profile concurrently.
+
+    Previews are cut to 500 characters by database views, so only the
+    excerpts that end up in the prompt are transferred. With a watermark
+    from an earlier summary, only documents processed and analyses created
+    after it are fetched.
+    """
+    watermark = watermark or {}
+    documents, analyses, profile = await asyncio.gather(
+        documents_repo.list_document_previews(context.username, watermark.get("documents_processed_at")),
+        medical_repo.list_analysis_previews(context.username, watermark.get("analyses_created_at")),
+        context.get_profile() if context.role == UserRole.PATIENT else _no_profile()
+    )
+    return {"documents": documents, "analyses": analyses, "profile": profile}
+
+def next_watermark(previous: Optional[Dict[str, Any]], sources: Dict[str, Any]) -> Dict[str, Any]:
+    """Advance a watermark past the documents and analyses in sources"""
+    watermark = dict(previous or {})
+    if sources["documents"]:
+        watermark["documents_processed_at"] = sources["documents"][-1]["processed_at"]
+    if sources["analyses"]:
+        watermark["analyses_created_at"] = sources["analyses"][-1]["created_at"]
+    watermark["profile_hash"] = profile_fingerprint(sources["profile"])
+    return watermark
+
+def has_changes(previous: Optional[Dict[str, Any]], sources: Dict[str, Any]) -> bool:
+    """Whether anything feeding the summary changed since the previous watermark"""
+    return bool(
+        sources["documents"]
+        or sources["analyses"]
+        or (previous or {}).get("profile_hash") != profile_fingerprint(sources["profile"])
+    )
+
+def build_history_context(
+    documents: List[Dict[str, Any]],
+    analyses: List[Dict[str, Any]]
+) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Join document and analysis excerpts, oldest first, up to MAX_CONTEXT_CHARS.
+
+    Returns the context and the documents and analyses that made it in.
+    Those are the oldest of each, so a watermark advanced past them (and
+    no further) leaves the rest for the next summary. Items sharing a
+    timestamp with one that did not fit are held back together, since the
+    watermark cannot split them.
+    """
+    items = [("documents", doc["processed_at"], doc, doc.get("text_preview")) for doc in documents]
+    items += [("analyses", analysis["created_at"], analysis, analysis.get("analysis_preview")) for analysis in analyses]
+    items.sort(key=lambda item: item[1] or "")
+
+    used: Dict[str, List[Dict[str, Any]]] = {"documents": [], "analyses": []}
+    held_back: Dict[str, Any] = {}
+    excerpts: List[str] = []
+    size = 0
+    for kind, timestamp, row, excerpt in items:
+        if kind in held_back:
+            continue
+        cost = len(excerpt) + 2 if excerpt else 0
+        # The first excerpt always goes in (truncated if need be) so every summary makes progress
+        if excerpts and size + cost > MAX_CONTEXT_CHARS:
+            held_back[kind] = timestamp
+            continue
+        used[kind].append(row)
+        if excerpt:
+            excerpts.append(excerpt)
+            size += cost
+
+    for kind, timestamp in held_back.items():
+        kept = [row for row in used[kind] if row.get("processed_at" if kind == "documents" else "created_at") != timestamp]
+        if kept or used["documents" if kind == "analyses" else "analyses"]:
+            used[kind] = kept
+
+    included = {id(row) for rows in used.values() for row in rows}
+    context = "\n\n".join(excerpt for _, _, row, excerpt in items if excerpt and id(row) in included)
+    return context[:MAX_CONTEXT_CHARS], used["documents"], used["analyses"]
+
+def build_profile_context(profile: Optional[Dict[str, Any]]) -> str:
+    """Describe the self-reported parts of a patient profile"""
+    profile_context = ""
+    if profile:
+        if profile.get("medical_history"):
+            profile_context += f"Self-reported medical history: {profile['medical_history']}\n"
+        if profile.get("allergies"):
+            profile_context += f"Allergies: {profile['allergies']}\n"
+        if profile.get("current_medications"):
+            profile_context += f"Current medications: {profile['current_medications']}\n"
+    return profile_context